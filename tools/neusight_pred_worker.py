@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Long-lived pred.py runner for neusight_predict_server.py.
+#
+# Reads one JSON job per line on stdin and runs pred.py in-process with the
+# job's argv, so torch/NeuSight are imported once per worker instead of once
+# per request. Each job gets exactly one JSON reply line on stdout:
+#   {"ping": true}          -> {"ok": true}
+#   {"argv": ["--...", ...]} -> {"returncode": N, "output": "..."}
+import contextlib
+import io
+import json
+import os
+import runpy
+import sys
+import traceback
+
+
+def run_job(pred_script: str, argv: list) -> dict:
+    out = io.StringIO()
+    returncode = 0
+    saved_argv = sys.argv
+    sys.argv = [pred_script, *argv]
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            runpy.run_path(pred_script, run_name="__main__")
+    except SystemExit as exc:
+        if exc.code is None:
+            returncode = 0
+        elif isinstance(exc.code, int):
+            returncode = exc.code
+        else:
+            out.write(f"{exc.code}\n")
+            returncode = 1
+    except Exception:
+        traceback.print_exc(file=out)
+        returncode = 1
+    finally:
+        sys.argv = saved_argv
+    output = out.getvalue()
+    if output:
+        sys.stderr.write(output)
+        sys.stderr.flush()
+    return {"returncode": returncode, "output": output[-4000:]}
+
+
+def main() -> int:
+    if len(sys.argv) != 2:
+        sys.stderr.write("usage: neusight_pred_worker.py PRED_SCRIPT\n")
+        return 2
+    pred_script = os.path.abspath(sys.argv[1])
+    sys.path.insert(0, os.path.dirname(pred_script))
+
+    # Replies own the real stdout; stray prints (including from C extensions)
+    # are pointed at stderr so they cannot corrupt the protocol.
+    reply = os.fdopen(os.dup(sys.stdout.fileno()), "w", buffering=1)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        job = json.loads(line)
+        if job.get("ping"):
+            result = {"ok": True}
+        else:
+            result = run_job(pred_script, [str(arg) for arg in job.get("argv", [])])
+        reply.write(json.dumps(result) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
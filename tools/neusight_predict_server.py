@@ -1,17 +1,24 @@
 #!/usr/bin/env python3
 import argparse
+import contextlib
 import json
 import os
+import queue
 import shlex
+import signal
 import subprocess
 import sys
+import threading
 import time
+from collections import OrderedDict
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
 
 REPO_ROOT = Path(__file__).resolve().parent.parent
 ASPLOS_DIR = REPO_ROOT / "NeuSight" / "scripts" / "asplos"
 PRED_SCRIPT = ASPLOS_DIR.parent / "pred.py"
+WORKER_SCRIPT = Path(__file__).resolve().parent / "neusight_pred_worker.py"
 
 PREDICTOR_CONFIG = {
     "neusight": {
@@ -32,21 +39,277 @@ PREDICTOR_CONFIG = {
     },
 }
 
+PREDICT_CACHE_SIZE = 256
+CSV_CHUNK_SIZE = 64 * 1024
+CONFIG_STAT_TTL_S = 2.0
+# A prefork child that dies within PREFORK_MIN_UPTIME_S of starting doubles the
+# restart delay (up to the max), so a child crashing at startup is not
+# re-forked in a tight loop.
+PREFORK_RESTART_DELAY_S = 0.5
+PREFORK_RESTART_MAX_DELAY_S = 30.0
+PREFORK_MIN_UPTIME_S = 10.0
+# Fixed responses are encoded once.
+HEALTH_BODY = json.dumps({"ok": True}).encode("utf-8")
+NOT_FOUND_BODY = json.dumps({"ok": False, "error": "not found"}).encode("utf-8")
+_predict_cache: "OrderedDict[tuple, tuple[str, int, int]]" = OrderedDict()
+_predict_cache_lock = threading.Lock()
+_config_stat_cache: "dict[Path, tuple[float, int | None]]" = {}
+_pred_pool: "PredictorPool | None" = None
+_predict_slots: "threading.BoundedSemaphore | None" = None
+
 
 def log_line(message: str) -> None:
     sys.stderr.write(f"{message}\n")
     sys.stderr.flush()
 
 
-def json_response(handler: BaseHTTPRequestHandler, code: int, payload: dict) -> None:
-    data = json.dumps(payload).encode("utf-8")
+def json_response(
+    handler: BaseHTTPRequestHandler, code: int, payload: "dict | bytes", headers: dict | None = None
+) -> None:
+    data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
     handler.send_response(code)
     handler.send_header("Content-Type", "application/json")
     handler.send_header("Content-Length", str(len(data)))
+    for key, value in (headers or {}).items():
+        handler.send_header(key, value)
     handler.end_headers()
     handler.wfile.write(data)
 
 
+def send_csv_file(handler: BaseHTTPRequestHandler, csv_path: str, headers: dict) -> None:
+    with open(csv_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/csv")
+        handler.send_header("Content-Length", str(size))
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        # socket.sendfile uses os.sendfile where available and falls back to
+        # buffered send() elsewhere.
+        handler.connection.sendfile(f, 0, size)
+
+
+def send_prediction_json(handler: BaseHTTPRequestHandler, result: dict, headers: dict) -> None:
+    # Frame {..., "csv": "<escaped file>"} by hand so the CSV is escaped chunk by
+    # chunk straight from the file instead of being held in memory as one string.
+    with open(result["path"]) as f:
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.close_connection = True
+        handler.wfile.write((json.dumps(result)[:-1] + ', "csv": "').encode("utf-8"))
+        while chunk := f.read(CSV_CHUNK_SIZE):
+            handler.wfile.write(json.dumps(chunk)[1:-1].encode("utf-8"))
+        handler.wfile.write(b'"}')
+
+
+def base_pred_env() -> dict:
+    env = os.environ.copy()
+    env.setdefault("OPENBLAS_NUM_THREADS", "1")
+    local_neusight = str(REPO_ROOT / "NeuSight")
+    pythonpath = env.get("PYTHONPATH", "")
+    if pythonpath:
+        env["PYTHONPATH"] = f"{local_neusight}:{pythonpath}"
+    else:
+        env["PYTHONPATH"] = local_neusight
+    return env
+
+
+# Built once at import; requests only layer CUDA_VISIBLE_DEVICES on top.
+# subprocess never mutates the env mapping it is given, so sharing is safe.
+_BASE_PRED_ENV = base_pred_env()
+
+
+def build_pred_env(cuda_visible) -> dict:
+    if cuda_visible is None:
+        return _BASE_PRED_ENV
+    return {**_BASE_PRED_ENV, "CUDA_VISIBLE_DEVICES": str(cuda_visible)}
+
+
+class PredWorker:
+    def __init__(self, cuda_visible) -> None:
+        self.proc = subprocess.Popen(
+            [sys.executable, "-u", str(WORKER_SCRIPT), str(PRED_SCRIPT)],
+            cwd=str(ASPLOS_DIR),
+            env=build_pred_env(cuda_visible),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+
+    def request(self, job: dict) -> dict:
+        self.proc.stdin.write(json.dumps(job) + "\n")
+        self.proc.stdin.flush()
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError(f"pred worker exited with code {self.proc.wait()}")
+        return json.loads(line)
+
+    def ping(self) -> bool:
+        if self.proc.poll() is not None:
+            return False
+        try:
+            return bool(self.request({"ping": True}).get("ok"))
+        except (OSError, RuntimeError, ValueError):
+            return False
+
+    def close(self) -> None:
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+# Persistent pred.py workers per (predictor, CUDA_VISIBLE_DEVICES), spawned as
+# concurrent requests need them (up to `size`, 0 = no cap) so distinct
+# predictions still run in parallel; idle workers are reused and a dead one is
+# respawned on demand.
+class PredictorPool:
+    def __init__(self, size: int = 0) -> None:
+        self._size = size
+        self._lock = threading.Lock()
+        self._idle: dict[tuple, queue.Queue] = {}
+        self._spawned: dict[tuple, int] = {}
+        self._workers: set[PredWorker] = set()
+
+    def start(self, predictors) -> None:
+        for predictor in predictors:
+            key = (predictor, None)
+            self._release(key, self._acquire(key))
+
+    def _acquire(self, key: tuple) -> PredWorker:
+        with self._lock:
+            idle = self._idle.setdefault(key, queue.Queue())
+            try:
+                return idle.get_nowait()
+            except queue.Empty:
+                pass
+            spawn = not self._size or self._spawned.get(key, 0) < self._size
+            if spawn:
+                self._spawned[key] = self._spawned.get(key, 0) + 1
+        if not spawn:
+            return idle.get()
+        try:
+            worker = PredWorker(key[1])
+        except OSError:
+            with self._lock:
+                self._spawned[key] -= 1
+            raise
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _release(self, key: tuple, worker: PredWorker) -> None:
+        self._idle[key].put(worker)
+
+    def _respawn(self, key: tuple, worker: PredWorker) -> PredWorker:
+        worker.close()
+        log_line(f"respawning pred worker: predictor={key[0]} cuda_visible={key[1]}")
+        fresh = PredWorker(key[1])
+        with self._lock:
+            self._workers.discard(worker)
+            self._workers.add(fresh)
+        return fresh
+
+    def run(self, predictor: str, cuda_visible, argv: list) -> tuple[int, str]:
+        key = (predictor, None if cuda_visible is None else str(cuda_visible))
+        worker = self._acquire(key)
+        try:
+            if not worker.ping():
+                worker = self._respawn(key, worker)
+            try:
+                reply = worker.request({"argv": argv})
+            except (OSError, RuntimeError, ValueError) as exc:
+                worker = self._respawn(key, worker)
+                return 1, f"pred worker failed: {exc}"
+            return int(reply.get("returncode", 1)), str(reply.get("output", ""))
+        finally:
+            self._release(key, worker)
+
+    def close(self) -> None:
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            worker.close()
+
+
+class PendingPrediction:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = (1, "")
+
+
+# Identical predictions that are already running are joined instead of re-run:
+# the first request runs pred.py and concurrent duplicates share its result.
+class InflightPredictions:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._running: dict[tuple, PendingPrediction] = {}
+
+    def run(self, key: tuple, fn) -> tuple[int, str]:
+        with self._lock:
+            pending = self._running.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._running[key] = PendingPrediction()
+        if not owner:
+            log_line("predict joined in-flight run")
+            pending.done.wait()
+            return pending.result
+        try:
+            pending.result = fn()
+        except Exception as exc:
+            pending.result = (1, f"prediction failed: {exc}")
+            raise
+        finally:
+            with self._lock:
+                del self._running[key]
+            pending.done.set()
+        return pending.result
+
+
+_inflight = InflightPredictions()
+
+
+# Config stats are remembered for CONFIG_STAT_TTL_S, so edits (or newly added
+# configs) are picked up within that window rather than on the next request.
+def config_mtime(path: Path) -> int | None:
+    now = time.monotonic()
+    cached = _config_stat_cache.get(path)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        mtime = None
+    if len(_config_stat_cache) >= PREDICT_CACHE_SIZE:
+        _config_stat_cache.clear()
+    _config_stat_cache[path] = (now + CONFIG_STAT_TTL_S, mtime)
+    return mtime
+
+
+def execute_prediction(predictor: str, cuda_visible, pred_args: list) -> tuple[int, str]:
+    # Cache hits and joined duplicates never wait; only runs that reach pred.py
+    # take a slot.
+    with _predict_slots or contextlib.nullcontext():
+        if _pred_pool is not None:
+            return _pred_pool.run(predictor, cuda_visible, pred_args)
+        proc = subprocess.run(
+            [sys.executable, str(PRED_SCRIPT), *pred_args],
+            cwd=str(ASPLOS_DIR),
+            env=build_pred_env(cuda_visible),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        return proc.returncode, proc.stdout
+
+
 def run_prediction(payload: dict) -> dict:
     for key in ("model", "gpu", "predictor", "mode", "seq", "batch"):
         if key not in payload:
@@ -85,15 +348,32 @@ def run_prediction(payload: dict) -> dict:
 
     device_config = ASPLOS_DIR / "data" / "device_configs" / f"{gpu}.json"
     model_config = ASPLOS_DIR / "data" / "DLmodel_configs" / f"{model}.json"
-    if not device_config.exists():
+    device_mtime = config_mtime(device_config)
+    if device_mtime is None:
         return {"ok": False, "error": f"device config not found: {device_config}"}
-    if not model_config.exists():
+    model_mtime = config_mtime(model_config)
+    if model_mtime is None:
         return {"ok": False, "error": f"model config not found: {model_config}"}
 
+    # Predictions are deterministic for a given request + config contents, so
+    # repeated requests are served from memory instead of re-running pred.py.
+    signature = (model, gpu, predictor, mode, seq, batch, options, device_mtime, model_mtime)
+    with _predict_cache_lock:
+        cached = _predict_cache.get(signature)
+        if cached is not None:
+            _predict_cache.move_to_end(signature)
+    if cached is not None:
+        csv_path, csv_size, csv_mtime = cached
+        try:
+            csv_stat = os.stat(csv_path)
+        except OSError:
+            csv_stat = None
+        if csv_stat is not None and (csv_stat.st_size, csv_stat.st_mtime_ns) == (csv_size, csv_mtime):
+            log_line(f"predict cache hit: {csv_path}")
+            return {"ok": True, "path": csv_path, "elapsed_ms": 0, "cache": "HIT"}
+
     cfg = PREDICTOR_CONFIG[predictor]
-    cmd = [
-        sys.executable,
-        str(PRED_SCRIPT),
+    pred_args = [
         "--predictor_name",
         predictor,
         "--predictor_path",
@@ -115,99 +395,213 @@ def run_prediction(payload: dict) -> dict:
         "--options",
         options,
     ]
-
-    env = os.environ.copy()
-    env.setdefault("OPENBLAS_NUM_THREADS", "1")
-    local_neusight = str(REPO_ROOT / "NeuSight")
-    pythonpath = env.get("PYTHONPATH", "")
-    if pythonpath:
-        env["PYTHONPATH"] = f"{local_neusight}:{pythonpath}"
-    else:
-        env["PYTHONPATH"] = local_neusight
     cuda_visible = payload.get("cuda_visible_devices")
-    if cuda_visible is not None:
-        env["CUDA_VISIBLE_DEVICES"] = str(cuda_visible)
 
-    log_line(f"predict cmd: {shlex.join(cmd)}")
+    log_line(f"predict cmd: {shlex.join([sys.executable, str(PRED_SCRIPT), *pred_args])}")
     log_line(f"predict cwd: {ASPLOS_DIR}")
 
     start = time.time()
-    proc = subprocess.run(
-        cmd,
-        cwd=str(ASPLOS_DIR),
-        env=env,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-    )
+    inflight_key = (signature, None if cuda_visible is None else str(cuda_visible))
+    returncode, output = _inflight.run(inflight_key, lambda: execute_prediction(predictor, cuda_visible, pred_args))
     elapsed_ms = int((time.time() - start) * 1000)
-    log_line(f"predict exit={proc.returncode} elapsed_ms={elapsed_ms}")
+    log_line(f"predict exit={returncode} elapsed_ms={elapsed_ms}")
 
-    if proc.returncode != 0:
-        if proc.stdout:
-            sys.stderr.write(proc.stdout[-4000:] + "\n")
+    if returncode != 0:
+        if output:
+            sys.stderr.write(output[-4000:] + "\n")
             sys.stderr.flush()
         return {
             "ok": False,
             "error": "prediction failed",
-            "detail": proc.stdout[-4000:],
+            "detail": output[-4000:],
         }
 
     csv_name = f"{model}-{mode}-{seq}-{batch}"
     if options:
         csv_name = f"{csv_name}-{options}"
     csv_path = ASPLOS_DIR / "results" / "prediction" / gpu / predictor / f"{csv_name}.csv"
-    if not csv_path.exists():
+    try:
+        csv_stat = csv_path.stat()
+        with csv_path.open() as f:
+            csv_header = f.readline().rstrip("\n")
+    except OSError:
         return {"ok": False, "error": f"prediction CSV not found: {csv_path}"}
 
-    csv_text = csv_path.read_text()
-    csv_header = csv_text.splitlines()[0] if csv_text else ""
     log_line(f"predict csv: {csv_path} header={csv_header}")
-    return {"ok": True, "csv": csv_text, "path": str(csv_path), "elapsed_ms": elapsed_ms}
+    with _predict_cache_lock:
+        _predict_cache[signature] = (str(csv_path), csv_stat.st_size, csv_stat.st_mtime_ns)
+        _predict_cache.move_to_end(signature)
+        while len(_predict_cache) > PREDICT_CACHE_SIZE:
+            _predict_cache.popitem(last=False)
+    return {"ok": True, "path": str(csv_path), "elapsed_ms": elapsed_ms, "cache": "MISS"}
 
 
 class Handler(BaseHTTPRequestHandler):
     def do_GET(self) -> None:
-        if self.path == "/api/health":
-            json_response(self, 200, {"ok": True})
+        url = urlsplit(self.path)
+        if url.path == "/api/health":
+            json_response(self, 200, HEALTH_BODY)
+            return
+        if url.path == "/api/predict_csv":
+            payload = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            self.respond_prediction(payload, raw=True)
             return
-        json_response(self, 404, {"ok": False, "error": "not found"})
+        json_response(self, 404, NOT_FOUND_BODY)
 
     def do_POST(self) -> None:
-        if self.path != "/api/predict":
-            json_response(self, 404, {"ok": False, "error": "not found"})
+        if self.path not in ("/api/predict", "/api/predict_raw"):
+            json_response(self, 404, NOT_FOUND_BODY)
             return
         length = int(self.headers.get("Content-Length", "0"))
-        body = self.rfile.read(length)
         try:
-            payload = json.loads(body.decode("utf-8"))
-        except json.JSONDecodeError:
+            payload = json.loads(self.rfile.read(length))
+        except (json.JSONDecodeError, UnicodeDecodeError):
             json_response(self, 400, {"ok": False, "error": "invalid json"})
             return
+        self.respond_prediction(payload, raw=self.path == "/api/predict_raw")
+
+    def respond_prediction(self, payload: dict, raw: bool) -> None:
         result = run_prediction(payload)
-        code = 200 if result.get("ok") else 400
-        json_response(self, code, result)
+        cache = result.pop("cache", None)
+        headers = {"X-Cache": cache} if cache else {}
+        if not result.get("ok"):
+            json_response(self, 400, result, headers)
+            return
+        try:
+            if raw:
+                headers["X-Predict-Path"] = result["path"]
+                headers["X-Predict-Ms"] = str(result["elapsed_ms"])
+                send_csv_file(self, result["path"], headers)
+            else:
+                send_prediction_json(self, result, headers)
+        except FileNotFoundError:
+            json_response(self, 400, {"ok": False, "error": f"prediction CSV not found: {result['path']}"})
 
     def log_message(self, fmt: str, *args) -> None:
         sys.stderr.write("%s - - [%s] %s\n" % (self.client_address[0], self.log_date_time_string(), fmt % args))
 
 
+def serve(server: ThreadingHTTPServer, spawn_per_request: bool, pool_size: int) -> None:
+    global _pred_pool
+    if not spawn_per_request:
+        _pred_pool = PredictorPool(pool_size)
+        _pred_pool.start(PREDICTOR_CONFIG)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if _pred_pool is not None:
+            _pred_pool.close()
+
+
+# Prefork mode: every child serves the same listening socket with its own
+# threads, predictor pool and cache, so request handling is not bound to one
+# GIL. Pools are created after fork; the parent only restarts children that
+# exit abnormally, with backoff.
+def serve_prefork(server: ThreadingHTTPServer, workers: int, spawn_per_request: bool, pool_size: int) -> None:
+    children: dict[int, float] = {}
+    delay = PREFORK_RESTART_DELAY_S
+
+    def fork_worker() -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                serve(server, spawn_per_request, pool_size)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    def interrupt(signum, frame) -> None:
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, interrupt)
+    for _ in range(workers):
+        fork_worker()
+    try:
+        while children:
+            pid, status = os.wait()
+            started = children.pop(pid, None)
+            code = os.waitstatus_to_exitcode(status)
+            if code == 0:
+                log_line(f"server worker {pid} exited cleanly")
+                continue
+            if started is not None and time.monotonic() - started < PREFORK_MIN_UPTIME_S:
+                delay = min(delay * 2, PREFORK_RESTART_MAX_DELAY_S)
+            else:
+                delay = PREFORK_RESTART_DELAY_S
+            log_line(f"server worker {pid} exited code={code}, restarting in {delay:.1f}s")
+            time.sleep(delay)
+            fork_worker()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description="NeuSight prediction backend")
     parser.add_argument("--host", default="127.0.0.1")
     parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument(
+        "--spawn-per-request",
+        action="store_true",
+        help="Run a fresh pred.py process per request instead of persistent workers",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of forked server processes sharing the port (each with its own pred.py workers)",
+    )
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        default=0,
+        help="Max predictions running at once per server process (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--pred-workers",
+        type=int,
+        default=0,
+        help="Max persistent pred.py workers per predictor (default: --max-inflight, else one per concurrent request)",
+    )
     args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be >= 1")
+    if args.workers > 1 and not hasattr(os, "fork"):
+        parser.error("--workers > 1 requires os.fork")
 
     if not ASPLOS_DIR.exists() or not PRED_SCRIPT.exists():
         sys.stderr.write("NeuSight scripts not found. Run from repo root.\n")
         return 1
 
+    global _predict_slots
+    if args.max_inflight > 0:
+        _predict_slots = threading.BoundedSemaphore(args.max_inflight)
+
+    pool_size = args.pred_workers or args.max_inflight
     server = ThreadingHTTPServer((args.host, args.port), Handler)
-    sys.stderr.write(f"listening on http://{args.host}:{args.port}\n")
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        sys.stderr.write("shutdown\n")
+    sys.stderr.write(f"listening on http://{args.host}:{args.port} workers={args.workers}\n")
+    if args.workers > 1:
+        serve_prefork(server, args.workers, args.spawn_per_request, pool_size)
+    else:
+        serve(server, args.spawn_per_request, pool_size)
+    server.server_close()
+    sys.stderr.write("shutdown\n")
     return 0
 
 
@@ -2,37 +2,94 @@
 import argparse
 import ast
 import csv
+import functools
+import glob
+import itertools
 import json
+import operator
+import os
 import re
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-COMM_OPS = {
-    "ALLREDUCE",
-    "ALLREDUCE_ASYNC",
-    "ALLGATHER",
-    "REDUCESCATTER",
-    "ALLTOALL",
-    "ALLTOALL_EP",
-    "ALLGATHER_DP_EP",
-    "REDUCESCATTER_DP_EP",
-    "SENDRECV",
+COMM_OPS = frozenset(
+    {
+        "ALLREDUCE",
+        "ALLREDUCE_ASYNC",
+        "ALLGATHER",
+        "REDUCESCATTER",
+        "ALLTOALL",
+        "ALLTOALL_EP",
+        "ALLGATHER_DP_EP",
+        "REDUCESCATTER_DP_EP",
+        "SENDRECV",
+    }
+)
+
+COMM_OP_NORMALIZED = {
+    "ALLREDUCE": "allreduce",
+    "ALLREDUCE_ASYNC": "allreduce_async",
+    "ALLGATHER": "allgather",
+    "ALLGATHER_DP_EP": "allgather",
+    "REDUCESCATTER": "reducescatter",
+    "REDUCESCATTER_DP_EP": "reducescatter",
+    "ALLTOALL": "alltoall",
+    "ALLTOALL_EP": "alltoall",
+    "SENDRECV": "sendrecv",
 }
 
+_DEVICE_PREFIXES = ("NVIDIA_", "AMD_", "Tesla_")
+_MODEL_RE = re.compile(r"([a-zA-Z0-9_]+)-")
+
+# (model family substring, first-layer start row candidates, first-layer end row),
+# checked in order against the lowercased model name.
+LAYER_BOUNDARIES = (
+    ("bert", ("bert_encoder_layer_0_attention_self_query",), "bert_encoder_layer_0_output_layer_norm"),
+    ("gpt", ("transformer_h_0_ln_1_grad", "transformer_h_0_ln_1"), "add_15"),
+    ("opt", ("model_decoder_layers_0_self_attn_layer_norm",), "view_11"),
+)
+
+PRED_TEXT_COLUMNS = ("Name", "OpName", "CommGroup")
+PRED_OPS_COLUMNS = ("FwOps", "BwOps")
+PRED_SHAPE_COLUMNS = ("OutputShape",)
+PRED_LATENCY_COLUMNS = ("fw_latency", "bw_latency", "acc_latency")
+# Below this many ranks per worker, pool startup costs more than it saves.
+RANK_POOL_MIN_RANKS = 64
+
+
+_QUOTE_TO_JSON = str.maketrans("'", '"')
+
+
+def _reject_json_constant(name):
+    raise ValueError(f"not a Python literal: {name}")
+
+
+# NeuSight cells are Python reprs such as "[['ALLREDUCE', [1024]]]". When they
+# carry no double quotes or escapes, swapping quotes makes them valid JSON, which
+# parses far faster than ast.literal_eval; anything else (tuples, True/None, ...)
+# falls through to literal_eval. Replicated layers repeat the same cells, so
+# results are memoized and shared: callers must treat them as read-only.
+@functools.lru_cache(maxsize=8192)
+def _parse_literal_cached(cell):
+    if '"' not in cell and "\\" not in cell:
+        try:
+            return json.loads(cell.translate(_QUOTE_TO_JSON), parse_constant=_reject_json_constant)
+        except ValueError:
+            pass
+    return ast.literal_eval(cell)
+
 
 def parse_ops(cell):
-    if not cell:
-        return []
-    try:
-        return ast.literal_eval(cell)
-    except (ValueError, SyntaxError):
-        return []
+    return parse_literal(cell, [])
 
 
 def parse_literal(cell, default):
-    if not cell:
+    if not cell or not isinstance(cell, str):
         return default
     try:
-        return ast.literal_eval(cell)
+        return _parse_literal_cached(cell)
     except (ValueError, SyntaxError):
         return default
 
@@ -54,15 +111,11 @@ def extract_comm_ops(ops):
 
 
 def find_device_from_path(path: Path):
-    parts = list(path.parts)
-    for part in parts:
-        if part.startswith("NVIDIA_") or part.startswith("AMD_") or part.startswith("Tesla_"):
-            return part.replace("_", " ")
-    return None
+    return next((part.replace("_", " ") for part in path.parts if part.startswith(_DEVICE_PREFIXES)), None)
 
 
 def find_model_from_name(name: str):
-    m = re.match(r"([a-zA-Z0-9_]+)-", name)
+    m = _MODEL_RE.match(name)
     return m.group(1) if m else name
 
 
@@ -75,44 +128,6 @@ def infer_fat_tree_k(hosts: int):
     return None
 
 
-def replicate_layers(rows, model_name, num_layers):
-    if not num_layers or num_layers <= 1:
-        return rows
-
-    model_name = model_name.lower()
-    if "switch" in model_name:
-        return rows
-
-    def find_index(target):
-        for i, row in enumerate(rows):
-            if row.get("Name") == target:
-                return i
-        return None
-
-    if "bert" in model_name:
-        start = find_index("bert_encoder_layer_0_attention_self_query")
-        end = find_index("bert_encoder_layer_0_output_layer_norm")
-    elif "gpt" in model_name:
-        start = find_index("transformer_h_0_ln_1_grad")
-        if start is None:
-            start = find_index("transformer_h_0_ln_1")
-        end = find_index("add_15")
-    elif "opt" in model_name:
-        start = find_index("model_decoder_layers_0_self_attn_layer_norm")
-        end = find_index("view_11")
-    else:
-        return rows
-
-    if start is None or end is None:
-        return rows
-
-    end = end + 1
-    prologue = rows[:start]
-    layer = rows[start:end]
-    epilogue = rows[end:]
-    return prologue + (layer * num_layers) + epilogue
-
-
 def parse_parallel_options(options: str):
     dp_degree = 1
     tp_degree = 1
@@ -138,34 +153,28 @@ def parse_parallel_options(options: str):
     return dp_degree, tp_degree, pp_degree, pp_num_microbatch
 
 
-def split_layers(rows, model_name, num_layers):
-    if not num_layers or num_layers <= 1:
-        return [], [rows], []
-
+def find_layer_bounds(rows, model_name):
     model_name = model_name.lower()
     if "switch" in model_name:
-        return [], [rows], []
+        return None, None
 
-    def find_index(target):
-        for i, row in enumerate(rows):
-            if row.get("Name") == target:
-                return i
-        return None
+    boundaries = next((entry[1:] for entry in LAYER_BOUNDARIES if entry[0] in model_name), None)
+    if boundaries is None:
+        return None, None
 
-    if "bert" in model_name:
-        start = find_index("bert_encoder_layer_0_attention_self_query")
-        end = find_index("bert_encoder_layer_0_output_layer_norm")
-    elif "gpt" in model_name:
-        start = find_index("transformer_h_0_ln_1_grad")
-        if start is None:
-            start = find_index("transformer_h_0_ln_1")
-        end = find_index("add_15")
-    elif "opt" in model_name:
-        start = find_index("model_decoder_layers_0_self_attn_layer_norm")
-        end = find_index("view_11")
-    else:
+    name_to_idx = {}
+    for i, row in enumerate(rows):
+        name_to_idx.setdefault(row.get("Name"), i)
+    start_names, end_name = boundaries
+    start = next((name_to_idx[name] for name in start_names if name in name_to_idx), None)
+    return start, name_to_idx.get(end_name)
+
+
+def split_layers(rows, model_name, num_layers):
+    if not num_layers or num_layers <= 1:
         return [], [rows], []
 
+    start, end = find_layer_bounds(rows, model_name)
     if start is None or end is None:
         return [], [rows], []
 
@@ -173,8 +182,8 @@ def split_layers(rows, model_name, num_layers):
     prologue = rows[:start]
     layer = rows[start:end]
     epilogue = rows[end:]
-    layers = [list(layer) for _ in range(num_layers)]
-    return prologue, layers, epilogue
+    # Every copy is the same list object; callers only read the layers.
+    return prologue, [layer] * num_layers, epilogue
 
 
 def comm_bytes_from_ops(ops, bytes_per_element):
@@ -182,20 +191,11 @@ def comm_bytes_from_ops(ops, bytes_per_element):
 
 
 def normalize_comm_op_name(raw):
-    name = str(raw or "").upper()
-    if name == "ALLREDUCE":
-        return "allreduce"
-    if name == "ALLREDUCE_ASYNC":
-        return "allreduce_async"
-    if name in ("ALLGATHER", "ALLGATHER_DP_EP"):
-        return "allgather"
-    if name in ("REDUCESCATTER", "REDUCESCATTER_DP_EP"):
-        return "reducescatter"
-    if name in ("ALLTOALL", "ALLTOALL_EP"):
-        return "alltoall"
-    if name == "SENDRECV":
-        return "sendrecv"
-    return name.lower()
+    norm = COMM_OP_NORMALIZED.get(raw) if isinstance(raw, str) else None
+    if norm is None:
+        name = str(raw or "").upper()
+        norm = COMM_OP_NORMALIZED.get(name, name.lower())
+    return norm
 
 
 def merge_comm_by_op(into, from_map):
@@ -249,24 +249,47 @@ def comm_stats_from_ops(ops, bytes_per_element):
     return total_bytes, by_op
 
 
+@functools.lru_cache(maxsize=16384)
+def comm_elems_for_cell(cell):
+    # Element counts (bytes_per_element=1) per raw ops cell; callers scale by
+    # the element size. The returned dict is shared and must not be mutated.
+    return comm_stats_from_ops(parse_ops(cell), 1)
+
+
+def scaled_comm_stats(comm_elems, bytes_per_element):
+    total, by_op = comm_elems
+    if not total:
+        return 0, {}
+    return total * bytes_per_element, {op: elems * bytes_per_element for op, elems in by_op.items()}
+
+
 def infer_comm_group(row):
-    name = str(row.get("Name", "")).lower()
-    opname = str(row.get("OpName", "")).lower()
+    return infer_comm_group_from_names(str(row.get("Name", "")), str(row.get("OpName", "")))
+
+
+# Row names repeat across replicated layers and prediction files.
+@functools.lru_cache(maxsize=4096)
+def infer_comm_group_from_names(name, opname):
+    name = name.lower()
+    opname = opname.lower()
     if "sendrecv" in name or opname == "sendrecv":
         return "pp"
     if name.endswith("_grad") and opname == "allreduce":
         return "dp"
-    if (
-        "tensor_model_parallel" in name
-        or "reduce_from_tensor_model_parallel_region" in name
-        or "gather_from_tensor_model_parallel_region" in name
-        or "reduce_scatter_to_tensor_model_parallel_region" in name
-        or "scatter_to_tensor_model_parallel_region" in name
-    ):
+    # Covers the *_tensor_model_parallel_region mappings as well.
+    if "tensor_model_parallel" in name:
         return "tp"
     return ""
 
 
+def add_comm_by_op(into, from_map):
+    # Internal by-op maps already hold ints; like merge_comm_by_op, skip
+    # non-positive entries.
+    for op, value in from_map.items():
+        if value > 0:
+            into[op] += value
+
+
 def collect_layer_stats(rows, bytes_per_element):
     fw_compute_ms = 0.0
     bw_compute_ms = 0.0
@@ -274,51 +297,35 @@ def collect_layer_stats(rows, bytes_per_element):
     tp_bw_bytes = 0
     dp_bw_bytes = 0
     pp_bytes = 0
-    tp_fw_by_op = {}
-    tp_bw_by_op = {}
-    dp_bw_by_op = {}
-    unknown_fw_by_op = {}
-    unknown_bw_by_op = {}
+    tp_fw_by_op = defaultdict(int)
+    tp_bw_by_op = defaultdict(int)
+    dp_bw_by_op = defaultdict(int)
+    unknown_fw_by_op = defaultdict(int)
+    unknown_bw_by_op = defaultdict(int)
     for row in rows:
-        fw_ops = row.get("FwOps", [])
-        bw_ops = row.get("BwOps", [])
-        fw_comm, fw_by_op = comm_stats_from_ops(fw_ops, bytes_per_element)
-        bw_comm, bw_by_op = comm_stats_from_ops(bw_ops, bytes_per_element)
-        comm_group = row.get("CommGroup") or infer_comm_group(row)
-
-        if comm_group:
-            if comm_group == "tp":
-                tp_fw_bytes += fw_comm
-                tp_bw_bytes += bw_comm
-                merge_comm_by_op(tp_fw_by_op, fw_by_op)
-                merge_comm_by_op(tp_bw_by_op, bw_by_op)
-            elif comm_group == "dp":
-                dp_bw_bytes += fw_comm + bw_comm
-                merge_comm_by_op(dp_bw_by_op, fw_by_op)
-                merge_comm_by_op(dp_bw_by_op, bw_by_op)
-            elif comm_group == "pp":
-                pp_bytes = max(pp_bytes, fw_comm, bw_comm)
-            continue
-
-        fw_compute_ms += float(row.get("fw_latency") or 0.0)
-        bw_compute_ms += float(row.get("bw_latency") or 0.0) + float(row.get("acc_latency") or 0.0)
-
-        if fw_comm or bw_comm:
-            inferred = infer_comm_group(row)
-            if inferred == "tp":
-                tp_fw_bytes += fw_comm
-                tp_bw_bytes += bw_comm
-                merge_comm_by_op(tp_fw_by_op, fw_by_op)
-                merge_comm_by_op(tp_bw_by_op, bw_by_op)
-            elif inferred == "dp":
-                dp_bw_bytes += fw_comm + bw_comm
-                merge_comm_by_op(dp_bw_by_op, fw_by_op)
-                merge_comm_by_op(dp_bw_by_op, bw_by_op)
-            elif inferred == "pp":
-                pp_bytes = max(pp_bytes, fw_comm, bw_comm)
-            else:
-                merge_comm_by_op(unknown_fw_by_op, fw_by_op)
-                merge_comm_by_op(unknown_bw_by_op, bw_by_op)
+        fw_comm, fw_by_op = scaled_comm_stats(row["FwComm"], bytes_per_element)
+        bw_comm, bw_by_op = scaled_comm_stats(row["BwComm"], bytes_per_element)
+        comm_group = row.get("CommGroup") or row["InferredCommGroup"]
+
+        # Rows with a (given or inferred) comm group are pure communication;
+        # only ungrouped rows contribute compute, and their comm is unknown.
+        if not comm_group:
+            fw_compute_ms += row["fw_latency"]
+            bw_compute_ms += row["bw_latency"] + row["acc_latency"]
+            if fw_comm or bw_comm:
+                add_comm_by_op(unknown_fw_by_op, fw_by_op)
+                add_comm_by_op(unknown_bw_by_op, bw_by_op)
+        elif comm_group == "tp":
+            tp_fw_bytes += fw_comm
+            tp_bw_bytes += bw_comm
+            add_comm_by_op(tp_fw_by_op, fw_by_op)
+            add_comm_by_op(tp_bw_by_op, bw_by_op)
+        elif comm_group == "dp":
+            dp_bw_bytes += fw_comm + bw_comm
+            add_comm_by_op(dp_bw_by_op, fw_by_op)
+            add_comm_by_op(dp_bw_by_op, bw_by_op)
+        elif comm_group == "pp":
+            pp_bytes = max(pp_bytes, fw_comm, bw_comm)
 
     if pp_bytes <= 0 and rows:
         shape = rows[-1].get("OutputShape")
@@ -337,12 +344,58 @@ def collect_layer_stats(rows, bytes_per_element):
         "tp_bw_bytes": tp_bw_bytes,
         "dp_bw_bytes": dp_bw_bytes,
         "pp_bytes": pp_bytes,
+        "tp_fw_by_op": dict(tp_fw_by_op),
+        "tp_bw_by_op": dict(tp_bw_by_op),
+        "dp_bw_by_op": dict(dp_bw_by_op),
+        "unknown_fw_by_op": dict(unknown_fw_by_op),
+        "unknown_bw_by_op": dict(unknown_bw_by_op),
+    }
+
+
+def add_extra_stats(stage_stat, extra):
+    stage_stat["fw_compute_ms"] += extra["fw_compute_ms"]
+    stage_stat["bw_compute_ms"] += extra["bw_compute_ms"]
+    stage_stat["tp_fw_bytes"] += extra["tp_fw_bytes"]
+    stage_stat["tp_bw_bytes"] += extra["tp_bw_bytes"]
+    stage_stat["dp_bw_bytes"] += extra["dp_bw_bytes"]
+    merge_comm_by_op(stage_stat["tp_fw_by_op"], extra.get("tp_fw_by_op"))
+    merge_comm_by_op(stage_stat["tp_bw_by_op"], extra.get("tp_bw_by_op"))
+    merge_comm_by_op(stage_stat["dp_bw_by_op"], extra.get("dp_bw_by_op"))
+    merge_comm_by_op(stage_stat["unknown_fw_by_op"], extra.get("unknown_fw_by_op"))
+    merge_comm_by_op(stage_stat["unknown_bw_by_op"], extra.get("unknown_bw_by_op"))
+
+
+def build_stage_stat(chunk, prologue_stats=None, epilogue_stats=None):
+    tp_fw_by_op = {}
+    tp_bw_by_op = {}
+    dp_bw_by_op = {}
+    unknown_fw_by_op = {}
+    unknown_bw_by_op = {}
+    for item in chunk:
+        merge_comm_by_op(tp_fw_by_op, item.get("tp_fw_by_op"))
+        merge_comm_by_op(tp_bw_by_op, item.get("tp_bw_by_op"))
+        merge_comm_by_op(dp_bw_by_op, item.get("dp_bw_by_op"))
+        merge_comm_by_op(unknown_fw_by_op, item.get("unknown_fw_by_op"))
+        merge_comm_by_op(unknown_bw_by_op, item.get("unknown_bw_by_op"))
+    stage_stat = {
+        "fw_compute_ms": sum(item["fw_compute_ms"] for item in chunk),
+        "bw_compute_ms": sum(item["bw_compute_ms"] for item in chunk),
+        "tp_fw_bytes": sum(item["tp_fw_bytes"] for item in chunk),
+        "tp_bw_bytes": sum(item["tp_bw_bytes"] for item in chunk),
+        "dp_bw_bytes": sum(item["dp_bw_bytes"] for item in chunk),
+        "pp_bytes": chunk[-1]["pp_bytes"] if chunk else 0,
         "tp_fw_by_op": tp_fw_by_op,
         "tp_bw_by_op": tp_bw_by_op,
         "dp_bw_by_op": dp_bw_by_op,
         "unknown_fw_by_op": unknown_fw_by_op,
         "unknown_bw_by_op": unknown_bw_by_op,
     }
+    # Prologue rows run on the first stage, epilogue rows on the last.
+    if prologue_stats:
+        add_extra_stats(stage_stat, prologue_stats)
+    if epilogue_stats:
+        add_extra_stats(stage_stat, epilogue_stats)
+    return stage_stat
 
 
 def rank_for(dp_idx, pp_idx, tp_idx, dp_degree, pp_degree, tp_degree):
@@ -359,183 +412,206 @@ def build_rank_map(dp_degree, pp_degree, tp_degree):
     return ranks
 
 
-def build_rank_steps(
-    rank_info,
-    stage_stats,
-    dp_degree,
-    pp_degree,
-    tp_degree,
-    microbatches,
-    pipeline,
-    collective_wait,
-):
-    dp_idx = rank_info["dp"]
-    pp_idx = rank_info["pp"]
-    tp_idx = rank_info["tp"]
-
-    tp_group = [rank_for(dp_idx, pp_idx, t, dp_degree, pp_degree, tp_degree) for t in range(tp_degree)]
-    dp_group = [rank_for(d, pp_idx, tp_idx, dp_degree, pp_degree, tp_degree) for d in range(dp_degree)]
-
-    prev_rank = None
-    next_rank = None
-    if pp_idx > 0:
-        prev_rank = rank_for(dp_idx, pp_idx - 1, tp_idx, dp_degree, pp_degree, tp_degree)
-    if pp_idx + 1 < pp_degree:
-        next_rank = rank_for(dp_idx, pp_idx + 1, tp_idx, dp_degree, pp_degree, tp_degree)
-
-    stats = stage_stats[pp_idx]
-
-    steps = []
-
-    def pp_comm_id(direction, src_stage, microbatch):
-        return f"pp-{direction}-s{src_stage}-mb{microbatch}-dp{dp_idx}-tp{tp_idx}"
+def collective_plan(by_op, total_bytes):
+    # (label_suffix, comm_id_suffix, op, bytes) entries to emit for one by-op
+    # map. A single op (or the allreduce fallback) keeps the base label and
+    # comm_id; several ops get one collective each, suffixed and sorted by op.
+    items = []
+    for op, bytes_val in (by_op or {}).items():
+        try:
+            value = int(bytes_val)
+        except (TypeError, ValueError):
+            continue
+        if value <= 0:
+            continue
+        items.append((str(op), value))
+    if not items:
+        return [("", "", "allreduce", int(total_bytes))] if total_bytes > 0 else []
+    if len(items) == 1:
+        op, bytes_val = items[0]
+        return [("", "", op, bytes_val)]
+    return [(f"_{op}", f"-{op}", op, bytes_val) for op, bytes_val in sorted(items, key=lambda item: item[0])]
+
+
+def build_stage_template(stats, tp_degree):
+    # Everything a stage's ranks share: computed once per stage instead of per
+    # rank and microbatch.
+    tp_fw_by_op = dict(stats.get("tp_fw_by_op") or {})
+    tp_bw_by_op = dict(stats.get("tp_bw_by_op") or {})
+    dp_fw_by_op = {}
+    dp_bw_by_op = dict(stats.get("dp_bw_by_op") or {})
+    if tp_degree > 1:
+        merge_comm_by_op(tp_fw_by_op, stats.get("unknown_fw_by_op"))
+        merge_comm_by_op(tp_bw_by_op, stats.get("unknown_bw_by_op"))
+    else:
+        merge_comm_by_op(dp_fw_by_op, stats.get("unknown_fw_by_op"))
+        merge_comm_by_op(dp_bw_by_op, stats.get("unknown_bw_by_op"))
+    return {
+        "pp_bytes": stats["pp_bytes"],
+        "fw_compute_ms": stats["fw_compute_ms"],
+        "bw_compute_ms": stats["bw_compute_ms"],
+        "tp_fw": collective_plan(tp_fw_by_op, stats["tp_fw_bytes"]),
+        # If tensor-parallel is disabled, still model forward comm on data-parallel ranks.
+        "dp_fw": collective_plan(dp_fw_by_op, 0) if tp_degree <= 1 else [],
+        "tp_bw": collective_plan(tp_bw_by_op, stats["tp_bw_bytes"]),
+        "dp_bw": collective_plan(dp_bw_by_op, stats["dp_bw_bytes"]),
+    }
 
-    def tp_comm_id(direction, microbatch):
-        return f"tp-{direction}-pp{pp_idx}-dp{dp_idx}-mb{microbatch}"
 
-    def dp_comm_id(direction, microbatch):
-        return f"dp-{direction}-pp{pp_idx}-tp{tp_idx}-mb{microbatch}"
+def add_compute(steps, label, ms):
+    if ms <= 0:
+        return
+    steps.append({"kind": "compute", "label": label, "compute_ms": round(ms, 6)})
 
-    def add_compute(label, ms):
-        if ms <= 0:
-            return
-        steps.append({"kind": "compute", "label": label, "compute_ms": round(ms, 6)})
 
-    def add_collective(label, op, comm_bytes, hosts, comm_id):
-        if comm_bytes <= 0:
-            return
-        steps.append(
+def add_collectives(steps, label, plan, hosts, comm_id):
+    append = steps.append
+    for label_suffix, comm_id_suffix, op, comm_bytes in plan:
+        append(
             {
                 "kind": "collective",
-                "label": label,
+                "label": label + label_suffix,
                 "op": op,
-                "comm_bytes": int(comm_bytes),
+                "comm_bytes": comm_bytes,
                 "hosts": hosts,
-                "comm_id": comm_id,
+                "comm_id": comm_id + comm_id_suffix,
             }
         )
 
-    def add_collectives_by_op(label, by_op, total_bytes, hosts, comm_id):
-        items = []
-        for op, bytes_val in (by_op or {}).items():
-            try:
-                value = int(bytes_val)
-            except (TypeError, ValueError):
-                continue
-            if value <= 0:
-                continue
-            items.append((str(op), value))
-        if not items:
-            add_collective(label, "allreduce", total_bytes, hosts, comm_id)
-            return
-        if len(items) == 1:
-            op, bytes_val = items[0]
-            add_collective(label, op, bytes_val, hosts, comm_id)
-            return
-        for op, bytes_val in sorted(items, key=lambda item: item[0]):
-            add_collective(f"{label}_{op}", op, bytes_val, hosts, f"{comm_id}-{op}")
-
-    def add_sendrecv(label, comm_bytes, peer, direction, comm_id):
-        if comm_bytes <= 0 or peer is None:
-            return
-        steps.append(
-            {
-                "kind": "sendrecv",
-                "label": label,
-                "comm_bytes": int(comm_bytes),
-                "peer": peer,
-                "direction": direction,
-                "comm_id": comm_id,
-            }
-        )
 
-    def forward_step(microbatch):
-        tp_fw_by_op = dict(stats.get("tp_fw_by_op") or {})
-        dp_fw_by_op = {}
-        if tp_degree > 1:
-            merge_comm_by_op(tp_fw_by_op, stats.get("unknown_fw_by_op"))
-        else:
-            merge_comm_by_op(dp_fw_by_op, stats.get("unknown_fw_by_op"))
-
-        if prev_rank is not None:
-            add_sendrecv(
-                f"fwd_recv_mb{microbatch}",
-                stats["pp_bytes"],
-                prev_rank,
-                "recv",
-                pp_comm_id("fwd", pp_idx - 1, microbatch),
-            )
-        add_compute(f"fwd_mb{microbatch}", stats["fw_compute_ms"])
-        add_collectives_by_op(
-            f"tp_fwd_mb{microbatch}",
-            tp_fw_by_op,
-            stats["tp_fw_bytes"],
-            tp_group,
-            tp_comm_id("fwd", microbatch),
-        )
-        # If tensor-parallel is disabled, still model forward comm on data-parallel ranks.
-        if tp_degree <= 1:
-            add_collectives_by_op(
-                f"dp_fwd_mb{microbatch}",
-                dp_fw_by_op,
-                0,
-                dp_group,
-                dp_comm_id("fwd", microbatch),
-            )
-        if next_rank is not None:
-            add_sendrecv(
-                f"fwd_send_mb{microbatch}",
-                stats["pp_bytes"],
-                next_rank,
-                "send",
-                pp_comm_id("fwd", pp_idx, microbatch),
-            )
+def add_sendrecv(steps, label, comm_bytes, peer, direction, comm_id):
+    if comm_bytes <= 0 or peer is None:
+        return
+    steps.append(
+        {
+            "kind": "sendrecv",
+            "label": label,
+            "comm_bytes": int(comm_bytes),
+            "peer": peer,
+            "direction": direction,
+            "comm_id": comm_id,
+        }
+    )
 
-    def backward_step(microbatch):
-        tp_bw_by_op = dict(stats.get("tp_bw_by_op") or {})
-        dp_bw_by_op = dict(stats.get("dp_bw_by_op") or {})
-        if tp_degree > 1:
-            merge_comm_by_op(tp_bw_by_op, stats.get("unknown_bw_by_op"))
-        else:
-            merge_comm_by_op(dp_bw_by_op, stats.get("unknown_bw_by_op"))
-
-        if next_rank is not None:
-            add_sendrecv(
-                f"bwd_recv_mb{microbatch}",
-                stats["pp_bytes"],
-                next_rank,
-                "recv",
-                pp_comm_id("bwd", pp_idx + 1, microbatch),
-            )
-        add_compute(f"bwd_mb{microbatch}", stats["bw_compute_ms"])
-        add_collectives_by_op(
-            f"tp_bwd_mb{microbatch}",
-            tp_bw_by_op,
-            stats["tp_bw_bytes"],
-            tp_group,
-            tp_comm_id("bwd", microbatch),
-        )
-        add_collectives_by_op(
-            f"dp_bwd_mb{microbatch}",
-            dp_bw_by_op,
-            stats["dp_bw_bytes"],
-            dp_group,
-            dp_comm_id("bwd", microbatch),
-        )
-        if prev_rank is not None:
-            add_sendrecv(
-                f"bwd_send_mb{microbatch}",
-                stats["pp_bytes"],
-                prev_rank,
-                "send",
-                pp_comm_id("bwd", pp_idx, microbatch),
-            )
 
+def forward_step(steps, rank, template, microbatch):
+    mb = str(microbatch)
+    add_sendrecv(steps, "fwd_recv_mb" + mb, template["pp_bytes"], rank["prev"], "recv", rank["fwd_recv_id"] % mb)
+    add_compute(steps, "fwd_mb" + mb, template["fw_compute_ms"])
+    add_collectives(steps, "tp_fwd_mb" + mb, template["tp_fw"], rank["tp_group"], rank["tp_fwd_id"] + mb)
+    add_collectives(steps, "dp_fwd_mb" + mb, template["dp_fw"], rank["dp_group"], rank["dp_fwd_id"] + mb)
+    add_sendrecv(steps, "fwd_send_mb" + mb, template["pp_bytes"], rank["next"], "send", rank["fwd_send_id"] % mb)
+
+
+def backward_step(steps, rank, template, microbatch):
+    mb = str(microbatch)
+    add_sendrecv(steps, "bwd_recv_mb" + mb, template["pp_bytes"], rank["next"], "recv", rank["bwd_recv_id"] % mb)
+    add_compute(steps, "bwd_mb" + mb, template["bw_compute_ms"])
+    add_collectives(steps, "tp_bwd_mb" + mb, template["tp_bw"], rank["tp_group"], rank["tp_bwd_id"] + mb)
+    add_collectives(steps, "dp_bwd_mb" + mb, template["dp_bw"], rank["dp_group"], rank["dp_bwd_id"] + mb)
+    add_sendrecv(steps, "bwd_send_mb" + mb, template["pp_bytes"], rank["prev"], "send", rank["bwd_send_id"] % mb)
+
+
+MICROBATCH_PLACEHOLDER = "\x00"
+
+
+def microbatch_template(emit, rank, template):
+    # Run forward_step/backward_step once with a placeholder microbatch and
+    # keep each step split around it, so every microbatch is a dict copy plus
+    # two concatenations.
+    steps = []
+    emit(steps, rank, template, MICROBATCH_PLACEHOLDER)
+    entries = []
+    for step in steps:
+        label_head, label_tail = step["label"].split(MICROBATCH_PLACEHOLDER)
+        comm_id = step.get("comm_id")
+        comm_id_parts = comm_id.split(MICROBATCH_PLACEHOLDER) if comm_id is not None else (None, None)
+        entries.append((step, label_head, label_tail, *comm_id_parts))
+    return entries
+
+
+def emit_microbatch(steps, entries, microbatch):
+    mb = str(microbatch)
+    append = steps.append
+    for base, label_head, label_tail, comm_id_head, comm_id_tail in entries:
+        step = base.copy()
+        step["label"] = label_head + mb + label_tail
+        if comm_id_head is not None:
+            step["comm_id"] = comm_id_head + mb + comm_id_tail
+        append(step)
+
+
+def is_async_op(op):
+    op = str(op or "").strip().lower()
+    compact = "".join(ch for ch in op if ch not in ("_", "-"))
+    return compact.endswith("async")
+
+
+# Stand-ins for the rank-specific parts of a stage's shared steps: dp/tp
+# indices inside comm_ids, and RANK_FIELD + name for the dump_rank() field
+# that fills a whole value (rank id, hosts, peer).
+RANK_DP = "\x01"
+RANK_TP = "\x02"
+RANK_FIELD = "\x07"
+
+
+def hosts_text(group, pretty):
+    # Groups sit under ranks[].steps[].hosts: three levels deep when pretty.
+    return dump_json(group, pretty).replace("\n", "\n      ")
+
+
+def build_group_texts(dp_degree, pp_degree, tp_degree, pretty):
+    # Serialized hosts of every tp group (indexed [dp][pp]) and dp group
+    # (indexed [pp][tp]), shared by all ranks in the group.
+    tp_groups = [
+        [
+            hosts_text([rank_for(d, p, t, dp_degree, pp_degree, tp_degree) for t in range(tp_degree)], pretty)
+            for p in range(pp_degree)
+        ]
+        for d in range(dp_degree)
+    ]
+    dp_groups = [
+        [
+            hosts_text([rank_for(d, p, t, dp_degree, pp_degree, tp_degree) for d in range(dp_degree)], pretty)
+            for t in range(tp_degree)
+        ]
+        for p in range(pp_degree)
+    ]
+    return tp_groups, dp_groups
+
+
+def stage_context(pp_idx, pp_degree):
+    return {
+        "tp_group": RANK_FIELD + "tp_group",
+        "dp_group": RANK_FIELD + "dp_group",
+        "prev": RANK_FIELD + "prev" if pp_idx > 0 else None,
+        "next": RANK_FIELD + "next" if pp_idx + 1 < pp_degree else None,
+        # comm_id prefixes; only the microbatch index varies per step.
+        "fwd_recv_id": f"pp-fwd-s{pp_idx - 1}-mb%s-dp{RANK_DP}-tp{RANK_TP}",
+        "fwd_send_id": f"pp-fwd-s{pp_idx}-mb%s-dp{RANK_DP}-tp{RANK_TP}",
+        "bwd_recv_id": f"pp-bwd-s{pp_idx + 1}-mb%s-dp{RANK_DP}-tp{RANK_TP}",
+        "bwd_send_id": f"pp-bwd-s{pp_idx}-mb%s-dp{RANK_DP}-tp{RANK_TP}",
+        "tp_fwd_id": f"tp-fwd-pp{pp_idx}-dp{RANK_DP}-mb",
+        "tp_bwd_id": f"tp-bwd-pp{pp_idx}-dp{RANK_DP}-mb",
+        "dp_fwd_id": f"dp-fwd-pp{pp_idx}-tp{RANK_TP}-mb",
+        "dp_bwd_id": f"dp-bwd-pp{pp_idx}-tp{RANK_TP}-mb",
+    }
+
+
+def build_stage_steps(pp_idx, template, pp_degree, microbatches, pipeline, collective_wait):
+    # Every rank of a pipeline stage runs the same schedule; only comm_ids,
+    # hosts and peers differ, so the steps are built once per stage with
+    # placeholders for those (see stage_rank_format).
+    context = stage_context(pp_idx, pp_degree)
+    fwd = microbatch_template(forward_step, context, template)
+    bwd = microbatch_template(backward_step, context, template)
+
+    steps = []
     if pipeline == "fwd_bwd":
         for microbatch in range(microbatches):
-            forward_step(microbatch)
+            emit_microbatch(steps, fwd, microbatch)
         for microbatch in range(microbatches):
-            backward_step(microbatch)
+            emit_microbatch(steps, bwd, microbatch)
     else:
         num_warmup = min(microbatches, pp_degree - pp_idx - 1)
         num_remaining = microbatches - num_warmup
@@ -543,30 +619,26 @@ def build_rank_steps(
         bwd_idx = 0
 
         for _ in range(num_warmup):
-            forward_step(fwd_idx)
+            emit_microbatch(steps, fwd, fwd_idx)
             fwd_idx += 1
 
         for _ in range(num_remaining):
-            forward_step(fwd_idx)
+            emit_microbatch(steps, fwd, fwd_idx)
             fwd_idx += 1
-            backward_step(bwd_idx)
+            emit_microbatch(steps, bwd, bwd_idx)
             bwd_idx += 1
 
         while bwd_idx < microbatches:
-            backward_step(bwd_idx)
+            emit_microbatch(steps, bwd, bwd_idx)
             bwd_idx += 1
 
     # If any async collective was launched, the simulator needs an explicit wait
     # step to model the dependency point (e.g., end of iteration).
+    # Every microbatch emits the same collectives, so checking the stage's
+    # handful of planned ops stands in for scanning every step.
     if str(collective_wait or "").lower() == "end":
-        def is_async_collective(step):
-            if step.get("kind") != "collective":
-                return False
-            op = str(step.get("op") or "").strip().lower()
-            compact = "".join(ch for ch in op if ch not in ("_", "-"))
-            return compact.endswith("async")
-
-        if any(is_async_collective(step) for step in steps):
+        plans = (template["tp_fw"], template["dp_fw"], template["tp_bw"], template["dp_bw"])
+        if any(is_async_op(op) for plan in plans for _, _, op, _ in plan):
             steps.append({"kind": "collective_wait", "label": "collective_wait"})
 
     for idx, step in enumerate(steps):
@@ -574,21 +646,55 @@ def build_rank_steps(
     return steps
 
 
-def rows_to_steps(rows, hosts, bytes_per_element):
-    steps = []
-    compute_ms = 0.0
-    for row in rows:
-        fw_raw = row.get("FwOps", "")
-        bw_raw = row.get("BwOps", "")
-        fw_ops = fw_raw if isinstance(fw_raw, list) else parse_ops(fw_raw)
-        bw_ops = bw_raw if isinstance(bw_raw, list) else parse_ops(bw_raw)
-        comm_totals = {}
-        for name, size in extract_comm_ops(fw_ops).items():
-            comm_totals[name] = comm_totals.get(name, 0) + size
-        for name, size in extract_comm_ops(bw_ops).items():
+def stage_rank_format(steps, pretty):
+    # A stage's rank serialized once, as a %-format over dump_rank()'s fields:
+    # each rank is then one string substitution, with no per-step dicts to
+    # build or encode.
+    text = dump_json({"id": RANK_FIELD + "id", "steps": steps}, pretty).replace("%", "%%")
+    for name in ("id", "tp_group", "dp_group", "prev", "next"):
+        text = text.replace(json.dumps(RANK_FIELD + name), f"%({name})s")
+    return text.replace(json.dumps(RANK_DP)[1:-1], "%(dp)s").replace(json.dumps(RANK_TP)[1:-1], "%(tp)s")
+
+
+def merge_comm_totals(fw_ops, bw_ops):
+    comm_totals = {}
+    for ops in (fw_ops, bw_ops):
+        for name, size in extract_comm_ops(ops).items():
             comm_totals[name] = comm_totals.get(name, 0) + size
-        comm_elems = sum(comm_totals.values())
+    return tuple(comm_totals.items())
+
+
+@functools.lru_cache(maxsize=16384)
+def comm_totals_for_cells(fw_cell, bw_cell):
+    # Keyed on the raw FwOps/BwOps cell text: replicated or repeated ops rows
+    # are parsed and reduced once.
+    return merge_comm_totals(parse_ops(fw_cell), parse_ops(bw_cell))
+
+
+def row_comm_totals(row):
+    return row["CommTotals"]
+
+
+def row_compute_ms(row):
+    return row["fw_latency"] + row["bw_latency"] + row["acc_latency"]
+
+
+def fold_compute_ms(rows, compute_ms):
+    # reduce() adds left to right like the original += loop, so folded sums are
+    # bit-identical (sum() uses compensated summation on newer Pythons).
+    return functools.reduce(operator.add, [row_compute_ms(row) for row in rows], compute_ms)
+
+
+def scan_rows(rows, hosts, bytes_per_element, compute_ms):
+    # Segmented reduction: only comm rows become steps, and each run of compute
+    # rows between them is folded in a single pass.
+    steps = []
+    start = 0
+    for idx, row in enumerate(rows):
+        comm_totals = row_comm_totals(row)
+        comm_elems = sum(elems for _, elems in comm_totals)
         if comm_elems > 0:
+            compute_ms = fold_compute_ms(rows[start:idx], compute_ms)
             comm_bytes = comm_elems * bytes_per_element
             comm_ops = [
                 {
@@ -596,11 +702,11 @@ def rows_to_steps(rows, hosts, bytes_per_element):
                     "comm_elems": elems,
                     "comm_bytes": elems * bytes_per_element,
                 }
-                for name, elems in comm_totals.items()
+                for name, elems in comm_totals
             ]
             steps.append(
                 {
-                    "id": len(steps),
+                    "id": None,
                     "label": row.get("Name") or None,
                     "hosts": hosts,
                     "compute_ms": round(compute_ms, 6),
@@ -609,75 +715,192 @@ def rows_to_steps(rows, hosts, bytes_per_element):
                 }
             )
             compute_ms = 0.0
-            continue
+            start = idx + 1
+    return steps, fold_compute_ms(rows[start:], compute_ms)
+
+
+def rows_to_steps(rows, hosts, bytes_per_element, layer_rows=(), num_layers=0, epilogue_rows=()):
+    steps, compute_ms = scan_rows(rows, hosts, bytes_per_element, 0.0)
+
+    if layer_rows and num_layers > 0:
+        # Replicated layers are identical, so scan one copy and repeat its steps.
+        # Only the compute before the layer's first comm step depends on what
+        # precedes each copy; re-fold those rows onto the carried-in compute so
+        # the sums match a row-by-row scan exactly.
+        lead = 0
+        while lead < len(layer_rows) and not row_comm_totals(layer_rows[lead]):
+            lead += 1
+        lead_ms = [row_compute_ms(row) for row in layer_rows[:lead]]
+        layer_steps, layer_tail_ms = scan_rows(layer_rows[lead:], hosts, bytes_per_element, 0.0)
+        if layer_steps:
+            compute_ms = functools.reduce(operator.add, lead_ms, compute_ms)
+            first = dict(layer_steps[0])
+            first["compute_ms"] = round(compute_ms, 6)
+            steps.append(first)
+            steps.extend(map(dict, layer_steps[1:]))
+            # Every later copy starts from the layer's own tail compute, so the
+            # copies are identical: fix up and round the first step once.
+            repeat = [dict(layer_steps[0]), *layer_steps[1:]]
+            repeat[0]["compute_ms"] = round(functools.reduce(operator.add, lead_ms, layer_tail_ms), 6)
+            for _ in range(num_layers - 1):
+                steps.extend(map(dict, repeat))
+            compute_ms = layer_tail_ms
+        else:
+            for _ in range(num_layers):
+                compute_ms = functools.reduce(operator.add, lead_ms, compute_ms)
 
-        fw = float(row.get("fw_latency") or 0.0)
-        bw = float(row.get("bw_latency") or 0.0)
-        acc = float(row.get("acc_latency") or 0.0)
-        compute_ms += fw + bw + acc
+    epilogue_steps, compute_ms = scan_rows(epilogue_rows, hosts, bytes_per_element, compute_ms)
+    steps.extend(epilogue_steps)
 
     if compute_ms > 0:
         steps.append(
             {
-                "id": len(steps),
+                "id": None,
                 "label": "compute_tail",
                 "hosts": hosts,
                 "compute_ms": round(compute_ms, 6),
                 "comm_bytes": 0,
             }
         )
+    for idx, step in enumerate(steps):
+        step["id"] = idx
     return steps
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Convert NeuSight prediction CSV into workload.json")
-    parser.add_argument("--pred-csv", required=True, help="Path to NeuSight prediction CSV (with *_latency columns)")
-    parser.add_argument("--out", default="workload.json", help="Output workload.json path")
-    parser.add_argument("--summary-json", help="Optional NeuSight summary JSON to read num_layer")
-    parser.add_argument("--num-layers", type=int, help="Override number of layers to replicate")
-    parser.add_argument("--hosts", type=int, help="Number of hosts / ranks")
-    parser.add_argument("--schema-version", type=int, default=1, choices=[1, 2], help="Workload schema version")
-    parser.add_argument("--options", default="", help="Parallel options (dpX,tpY,ppZ_M)")
-    parser.add_argument("--dp", type=int, default=1, help="Data-parallel degree")
-    parser.add_argument("--tp", type=int, default=1, help="Tensor-parallel degree")
-    parser.add_argument("--pp", type=int, default=1, help="Pipeline-parallel degree")
-    parser.add_argument("--pp-microbatch", type=int, default=1, help="Pipeline microbatch count")
-    parser.add_argument("--layout", default="dp-pp-tp", choices=["dp-pp-tp"], help="Rank layout order")
-    parser.add_argument("--pipeline", default="1f1b", choices=["1f1b", "fwd_bwd"], help="Pipeline schedule")
-    parser.add_argument(
-        "--collective-wait",
-        default="end",
-        choices=["none", "end"],
-        help="Insert `collective_wait` for `*_async` collectives (schema_version=2)",
-    )
-    parser.add_argument("--gpu", help="GPU model (e.g. NVIDIA H100)")
-    parser.add_argument("--protocol", default="tcp", choices=["tcp", "dctcp"], help="Default transport protocol")
-    parser.add_argument("--routing", default="per_flow", choices=["per_flow", "per_packet"], help="ECMP routing mode")
-    parser.add_argument("--bytes-per-element", type=int, default=4, help="Element size for comm bytes")
-    parser.add_argument("--topo-kind", choices=["dumbbell", "fat_tree"], help="Topology kind")
-    parser.add_argument("--k", type=int, help="Fat-tree k (required if topo-kind=fat_tree)")
-    parser.add_argument("--link-gbps", type=int, default=100, help="Fat-tree link bandwidth in Gbps")
-    parser.add_argument("--link-latency-us", type=int, default=2, help="Link latency in microseconds")
-    parser.add_argument("--host-link-gbps", type=int, default=100, help="Dumbbell host link bandwidth in Gbps")
-    parser.add_argument("--bottleneck-gbps", type=int, default=10, help="Dumbbell bottleneck bandwidth in Gbps")
-    args = parser.parse_args()
+def read_pred_rows(pred_path):
+    # Keep only the columns the converter reads: ops cells are parsed and
+    # latencies converted to float once here, not in the step loops.
+    rows = []
+    with pred_path.open() as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        index = {name: i for i, name in enumerate(header)}
+        text_cols = [(name, index[name]) for name in PRED_TEXT_COLUMNS if name in index]
+        ops_cols = [(name, index.get(name, -1)) for name in PRED_OPS_COLUMNS]
+        shape_cols = [(name, index.get(name, -1)) for name in PRED_SHAPE_COLUMNS]
+        latency_cols = [(name, index.get(name, -1)) for name in PRED_LATENCY_COLUMNS]
+        for values in reader:
+            if not values:
+                continue
+            width = len(values)
+            row = {name: values[i] for name, i in text_cols if i < width}
+            cells = [values[i] if 0 <= i < width else "" for _, i in ops_cols]
+            for (name, _), cell in zip(ops_cols, cells):
+                row[name] = parse_ops(cell)
+            fw_cell, bw_cell = cells
+            row["CommTotals"] = comm_totals_for_cells(fw_cell, bw_cell)
+            row["FwComm"] = comm_elems_for_cell(fw_cell)
+            row["BwComm"] = comm_elems_for_cell(bw_cell)
+            for name, i in shape_cols:
+                row[name] = parse_literal(values[i], []) if 0 <= i < width else []
+            for name, i in latency_cols:
+                row[name] = float(values[i] or 0.0) if 0 <= i < width else 0.0
+            row["InferredCommGroup"] = infer_comm_group(row)
+            rows.append(row)
+    return rows
 
-    pred_path = Path(args.pred_csv)
-    if not pred_path.exists():
-        raise SystemExit(f"prediction CSV not found: {pred_path}")
 
+def read_pred_rows_jsonl(pred_path):
+    # One JSON object per line with FwOps/BwOps as native lists, so no literal
+    # parsing is needed; string cells are still accepted.
     rows = []
     with pred_path.open() as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            row["FwOps"] = parse_literal(row.get("FwOps"), [])
-            row["BwOps"] = parse_literal(row.get("BwOps"), [])
-            row["AccOps"] = parse_literal(row.get("AccOps"), [])
-            row["InputShapes"] = parse_literal(row.get("InputShapes"), [])
-            row["OutputShape"] = parse_literal(row.get("OutputShape"), [])
-            for key in ("fw_latency", "bw_latency", "acc_latency", "bwall_latency", "e2e_latency"):
-                row[key] = float(row.get(key) or 0.0)
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            row = {name: record[name] for name in PRED_TEXT_COLUMNS if name in record}
+            for name in PRED_OPS_COLUMNS:
+                value = record.get(name)
+                row[name] = value if isinstance(value, list) else parse_ops(value)
+            for name in PRED_SHAPE_COLUMNS:
+                value = record.get(name)
+                row[name] = value if isinstance(value, list) else parse_literal(value, [])
+            for name in PRED_LATENCY_COLUMNS:
+                row[name] = float(record.get(name) or 0.0)
+            row["CommTotals"] = merge_comm_totals(row["FwOps"], row["BwOps"])
+            row["FwComm"] = comm_stats_from_ops(row["FwOps"], 1)
+            row["BwComm"] = comm_stats_from_ops(row["BwOps"], 1)
+            row["InferredCommGroup"] = infer_comm_group(row)
             rows.append(row)
+    return rows
+
+
+def dump_json(obj, pretty):
+    # One-shot dumps keeps the C encoder (json.dump to a file does not); indented
+    # unless --compact.
+    if pretty:
+        return json.dumps(obj, indent=2)
+    return json.dumps(obj, separators=(",", ":"))
+
+
+_rank_job = None
+
+
+def init_rank_worker(job):
+    global _rank_job
+    _rank_job = job
+
+
+def dump_rank(rank_info, job=None):
+    stage_formats, tp_groups, dp_groups, tp_degree = job or _rank_job
+    rank_id = rank_info["id"]
+    dp_idx = rank_info["dp"]
+    pp_idx = rank_info["pp"]
+    tp_idx = rank_info["tp"]
+    # Pipeline neighbours are one tp block away in the dp-pp-tp layout; the
+    # stage format only references the ones that exist.
+    return stage_formats[pp_idx] % {
+        "id": rank_id,
+        "dp": dp_idx,
+        "tp": tp_idx,
+        "tp_group": tp_groups[dp_idx][pp_idx],
+        "dp_group": dp_groups[pp_idx][tp_idx],
+        "prev": rank_id - tp_degree,
+        "next": rank_id + tp_degree,
+    }
+
+
+def dump_ranks(rank_map, job, workers):
+    if workers <= 1:
+        for rank_info in rank_map:
+            yield dump_rank(rank_info, job)
+        return
+    # Workers get the stage formats once via the initializer and send back
+    # serialized text, which pickles far cheaper than step dicts.
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_rank_worker, initargs=(job,)) as pool:
+        yield from pool.map(dump_rank, rank_map, chunksize=max(1, len(rank_map) // (workers * 4)))
+
+
+def write_workload(f, workload, ranks, pretty):
+    # A trailing "ranks" list (already serialized, one text per rank) is
+    # streamed after the rest of the workload, byte-identical to dumping the
+    # whole workload at once.
+    if ranks is None:
+        f.write(dump_json(workload, pretty))
+        return
+    head = dump_json({**workload, "ranks": []}, pretty)
+    tail = "[]\n}" if pretty else "[]}"
+    f.write(head[: -len(tail)])
+    f.write("[")
+    for idx, text in enumerate(ranks):
+        if pretty:
+            f.write(("," if idx else "") + "\n    " + text.replace("\n", "\n    "))
+        else:
+            f.write(("," if idx else "") + text)
+    f.write("\n  ]\n}" if pretty else "]}")
+
+
+def convert(pred_path, out_path, args):
+    if not pred_path.exists():
+        raise SystemExit(f"prediction CSV not found: {pred_path}")
+
+    pred_format = args.pred_format or ("jsonl" if pred_path.suffix == ".jsonl" else "csv")
+    if pred_format == "jsonl":
+        rows = read_pred_rows_jsonl(pred_path)
+    else:
+        rows = read_pred_rows(pred_path)
 
     model_name = find_model_from_name(pred_path.name)
     gpu_name = args.gpu or find_device_from_path(pred_path)
@@ -736,8 +959,8 @@ def main():
         hosts.append(entry)
 
     if args.schema_version == 1:
-        rows_full = replicate_layers(rows, model_name, num_layers) if num_layers else rows
-        steps = rows_to_steps(rows_full, host_ids, args.bytes_per_element)
+        prologue, layers, epilogue = split_layers(rows, model_name, num_layers)
+        steps = rows_to_steps(prologue, host_ids, args.bytes_per_element, layers[0], len(layers), epilogue)
         workload = {
             "schema_version": 1,
             "meta": {
@@ -755,6 +978,7 @@ def main():
             "hosts": hosts,
             "steps": steps,
         }
+        ranks = None
     else:
         if pp_degree > 1 and not num_layers:
             raise SystemExit("pp requires --num-layers or --summary-json")
@@ -769,85 +993,37 @@ def main():
             raise SystemExit("num_layers must be divisible by pp")
         per_stage_layer = len(layer_stats) // pp_degree
 
-        stage_stats = []
-        for stage in range(pp_degree):
-            start = stage * per_stage_layer
-            end = start + per_stage_layer
-            chunk = layer_stats[start:end]
-            tp_fw_by_op = {}
-            tp_bw_by_op = {}
-            dp_bw_by_op = {}
-            unknown_fw_by_op = {}
-            unknown_bw_by_op = {}
-            for item in chunk:
-                merge_comm_by_op(tp_fw_by_op, item.get("tp_fw_by_op"))
-                merge_comm_by_op(tp_bw_by_op, item.get("tp_bw_by_op"))
-                merge_comm_by_op(dp_bw_by_op, item.get("dp_bw_by_op"))
-                merge_comm_by_op(unknown_fw_by_op, item.get("unknown_fw_by_op"))
-                merge_comm_by_op(unknown_bw_by_op, item.get("unknown_bw_by_op"))
-            stage_stat = {
-                "fw_compute_ms": sum(item["fw_compute_ms"] for item in chunk),
-                "bw_compute_ms": sum(item["bw_compute_ms"] for item in chunk),
-                "tp_fw_bytes": sum(item["tp_fw_bytes"] for item in chunk),
-                "tp_bw_bytes": sum(item["tp_bw_bytes"] for item in chunk),
-                "dp_bw_bytes": sum(item["dp_bw_bytes"] for item in chunk),
-                "pp_bytes": chunk[-1]["pp_bytes"] if chunk else 0,
-                "tp_fw_by_op": tp_fw_by_op,
-                "tp_bw_by_op": tp_bw_by_op,
-                "dp_bw_by_op": dp_bw_by_op,
-                "unknown_fw_by_op": unknown_fw_by_op,
-                "unknown_bw_by_op": unknown_bw_by_op,
-            }
-            if stage == 0 and prologue_stats:
-                stage_stat["fw_compute_ms"] += prologue_stats["fw_compute_ms"]
-                stage_stat["bw_compute_ms"] += prologue_stats["bw_compute_ms"]
-                stage_stat["tp_fw_bytes"] += prologue_stats["tp_fw_bytes"]
-                stage_stat["tp_bw_bytes"] += prologue_stats["tp_bw_bytes"]
-                stage_stat["dp_bw_bytes"] += prologue_stats["dp_bw_bytes"]
-                merge_comm_by_op(stage_stat["tp_fw_by_op"], prologue_stats.get("tp_fw_by_op"))
-                merge_comm_by_op(stage_stat["tp_bw_by_op"], prologue_stats.get("tp_bw_by_op"))
-                merge_comm_by_op(stage_stat["dp_bw_by_op"], prologue_stats.get("dp_bw_by_op"))
-                merge_comm_by_op(
-                    stage_stat["unknown_fw_by_op"],
-                    prologue_stats.get("unknown_fw_by_op"),
-                )
-                merge_comm_by_op(
-                    stage_stat["unknown_bw_by_op"],
-                    prologue_stats.get("unknown_bw_by_op"),
-                )
-            if stage == pp_degree - 1 and epilogue_stats:
-                stage_stat["fw_compute_ms"] += epilogue_stats["fw_compute_ms"]
-                stage_stat["bw_compute_ms"] += epilogue_stats["bw_compute_ms"]
-                stage_stat["tp_fw_bytes"] += epilogue_stats["tp_fw_bytes"]
-                stage_stat["tp_bw_bytes"] += epilogue_stats["tp_bw_bytes"]
-                stage_stat["dp_bw_bytes"] += epilogue_stats["dp_bw_bytes"]
-                merge_comm_by_op(stage_stat["tp_fw_by_op"], epilogue_stats.get("tp_fw_by_op"))
-                merge_comm_by_op(stage_stat["tp_bw_by_op"], epilogue_stats.get("tp_bw_by_op"))
-                merge_comm_by_op(stage_stat["dp_bw_by_op"], epilogue_stats.get("dp_bw_by_op"))
-                merge_comm_by_op(
-                    stage_stat["unknown_fw_by_op"],
-                    epilogue_stats.get("unknown_fw_by_op"),
-                )
-                merge_comm_by_op(
-                    stage_stat["unknown_bw_by_op"],
-                    epilogue_stats.get("unknown_bw_by_op"),
-                )
-            stage_stats.append(stage_stat)
+        stage_stats = [
+            build_stage_stat(
+                layer_stats[stage * per_stage_layer : (stage + 1) * per_stage_layer],
+                prologue_stats if stage == 0 else None,
+                epilogue_stats if stage == pp_degree - 1 else None,
+            )
+            for stage in range(pp_degree)
+        ]
 
         microbatches = max(1, pp_microbatch)
-        ranks = []
-        for rank_info in build_rank_map(dp_degree, pp_degree, tp_degree):
-            steps = build_rank_steps(
-                rank_info,
-                stage_stats,
-                dp_degree,
-                pp_degree,
-                tp_degree,
-                microbatches,
-                args.pipeline,
-                args.collective_wait,
+        stage_formats = [
+            stage_rank_format(
+                build_stage_steps(
+                    pp_idx,
+                    build_stage_template(stats, tp_degree),
+                    pp_degree,
+                    microbatches,
+                    args.pipeline,
+                    args.collective_wait,
+                ),
+                args.pretty,
             )
-            ranks.append({"id": rank_info["id"], "steps": steps})
+            for pp_idx, stats in enumerate(stage_stats)
+        ]
+        tp_groups, dp_groups = build_group_texts(dp_degree, pp_degree, tp_degree, args.pretty)
+        rank_job = (stage_formats, tp_groups, dp_groups, tp_degree)
+        rank_map = build_rank_map(dp_degree, pp_degree, tp_degree)
+        # --pred-glob already spends --jobs on files; a single file spends it on ranks.
+        workers = 1 if args.pred_glob else min(args.jobs, len(rank_map) // RANK_POOL_MIN_RANKS)
+        # Built lazily while writing, so only a few ranks' steps are alive at a time.
+        ranks = dump_ranks(rank_map, rank_job, workers)
 
         workload = {
             "schema_version": 2,
@@ -872,13 +1048,102 @@ def main():
                 "bytes_per_element": args.bytes_per_element,
             },
             "hosts": hosts,
-            "ranks": ranks,
         }
 
-    out_path = Path(args.out)
-    out_path.write_text(json.dumps(workload, indent=2))
+    with out_path.open("w") as f:
+        write_workload(f, workload, ranks, args.pretty)
     print(f"wrote {out_path}")
 
 
+def convert_checked(job, args):
+    pred_path, out_path = job
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        convert(pred_path, out_path, args)
+    except (SystemExit, Exception) as exc:
+        return f"{pred_path}: {exc}"
+    return None
+
+
+def convert_many(args):
+    # One process per worker instead of one per file: the parse/comm memo
+    # caches stay warm across every file a worker converts.
+    pred_paths = sorted(Path(p) for p in glob.glob(args.pred_glob, recursive=True) if os.path.isfile(p))
+    if not pred_paths:
+        raise SystemExit(f"no prediction files match: {args.pred_glob}")
+    root = Path(os.path.commonpath([p.parent for p in pred_paths]))
+    out_dir = Path(args.out_dir)
+    jobs = [(p, out_dir / p.relative_to(root).with_suffix(".json")) for p in pred_paths]
+    sources = {}
+    for pred_path, out_path in jobs:
+        if out_path in sources:
+            raise SystemExit(f"{sources[out_path]} and {pred_path} would both write {out_path}")
+        sources[out_path] = pred_path
+    workers = min(args.jobs, len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            errors = list(pool.map(convert_checked, jobs, itertools.repeat(args)))
+    else:
+        errors = [convert_checked(job, args) for job in jobs]
+    errors = [error for error in errors if error]
+    for error in errors:
+        print(f"failed {error}", file=sys.stderr)
+    print(f"converted {len(jobs) - len(errors)}/{len(jobs)} files into {out_dir}")
+    return 1 if errors else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert NeuSight prediction CSV into workload.json")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--pred-csv", help="Path to NeuSight prediction CSV (with *_latency columns)")
+    source.add_argument("--pred-glob", help="Glob of prediction files to convert in one run (recursive **)")
+    parser.add_argument(
+        "--pred-format",
+        choices=["csv", "jsonl"],
+        help="Prediction file format (default: jsonl for *.jsonl, else csv)",
+    )
+    parser.add_argument("--out", default="workload.json", help="Output workload.json path")
+    parser.add_argument("--out-dir", default="workloads", help="Output directory for --pred-glob (mirrors input tree)")
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="Worker processes (files for --pred-glob, else ranks; default 1: no pool)"
+    )
+    parser.add_argument(
+        "--compact", dest="pretty", action="store_false", help="Write compact JSON instead of indented (smaller, faster)"
+    )
+    parser.add_argument("--summary-json", help="Optional NeuSight summary JSON to read num_layer")
+    parser.add_argument("--num-layers", type=int, help="Override number of layers to replicate")
+    parser.add_argument("--hosts", type=int, help="Number of hosts / ranks")
+    parser.add_argument("--schema-version", type=int, default=1, choices=[1, 2], help="Workload schema version")
+    parser.add_argument("--options", default="", help="Parallel options (dpX,tpY,ppZ_M)")
+    parser.add_argument("--dp", type=int, default=1, help="Data-parallel degree")
+    parser.add_argument("--tp", type=int, default=1, help="Tensor-parallel degree")
+    parser.add_argument("--pp", type=int, default=1, help="Pipeline-parallel degree")
+    parser.add_argument("--pp-microbatch", type=int, default=1, help="Pipeline microbatch count")
+    parser.add_argument("--layout", default="dp-pp-tp", choices=["dp-pp-tp"], help="Rank layout order")
+    parser.add_argument("--pipeline", default="1f1b", choices=["1f1b", "fwd_bwd"], help="Pipeline schedule")
+    parser.add_argument(
+        "--collective-wait",
+        default="end",
+        choices=["none", "end"],
+        help="Insert `collective_wait` for `*_async` collectives (schema_version=2)",
+    )
+    parser.add_argument("--gpu", help="GPU model (e.g. NVIDIA H100)")
+    parser.add_argument("--protocol", default="tcp", choices=["tcp", "dctcp"], help="Default transport protocol")
+    parser.add_argument("--routing", default="per_flow", choices=["per_flow", "per_packet"], help="ECMP routing mode")
+    parser.add_argument("--bytes-per-element", type=int, default=4, help="Element size for comm bytes")
+    parser.add_argument("--topo-kind", choices=["dumbbell", "fat_tree"], help="Topology kind")
+    parser.add_argument("--k", type=int, help="Fat-tree k (required if topo-kind=fat_tree)")
+    parser.add_argument("--link-gbps", type=int, default=100, help="Fat-tree link bandwidth in Gbps")
+    parser.add_argument("--link-latency-us", type=int, default=2, help="Link latency in microseconds")
+    parser.add_argument("--host-link-gbps", type=int, default=100, help="Dumbbell host link bandwidth in Gbps")
+    parser.add_argument("--bottleneck-gbps", type=int, default=10, help="Dumbbell bottleneck bandwidth in Gbps")
+    args = parser.parse_args()
+
+    if args.pred_glob:
+        return convert_many(args)
+    convert(Path(args.pred_csv), Path(args.out), args)
+    return 0
+
+
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -1,7 +1,7 @@
 import argparse
-import json
 from pathlib import Path
 
+from .config import write_json
 from .generator import generate_workload
 
 
@@ -27,37 +27,20 @@ def main() -> int:
         default="max",
         choices=["max", "mean", "compute", "memory", "none"],
     )
-    parser.add_argument("--model-backend", default="transformers", choices=["transformers", "minimal"])
+    parser.add_argument("--model-backend", default="transformers", choices=["transformers", "minimal", "analytical"])
+    parser.add_argument("--profile-layers", default="all", choices=["all", "single"])
+    parser.add_argument("--compile", action="store_true", help="torch.compile transformer blocks before profiling")
     parser.add_argument("--repo-root", default=None)
     parser.add_argument("--model-dir", default=None)
     parser.add_argument("--device-dir", default=None)
     parser.add_argument("--out", default="workload.json")
     args = parser.parse_args()
 
-    payload = {
-        "model": args.model,
-        "gpu": args.gpu,
-        "mode": args.mode,
-        "seq": args.seq,
-        "batch": args.batch,
-        "dp": args.dp,
-        "tp": args.tp,
-        "pp": args.pp,
-        "pp_microbatch": args.pp_microbatch,
-        "pipeline": args.pipeline,
-        "dtype": args.dtype,
-        "device": args.device,
-        "warmup_steps": args.warmup_steps,
-        "measure_steps": args.measure_steps,
-        "tp_comm_factor": args.tp_comm_factor,
-        "device_scale_mode": args.device_scale_mode,
-        "model_backend": args.model_backend,
-        "model_dir": args.model_dir,
-        "device_dir": args.device_dir,
-    }
+    # Every option except the output/root paths is a generator payload key.
+    payload = {key: value for key, value in vars(args).items() if key not in ("out", "repo_root")}
     workload = generate_workload(payload, repo_root=args.repo_root)
     out_path = Path(args.out)
-    out_path.write_text(json.dumps(workload, indent=2))
+    write_json(out_path, workload)
     print(f"wrote {out_path}")
     return 0
 
@@ -1,8 +1,14 @@
+import functools
 import json
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, List, Optional
 
+try:
+    import orjson
+except Exception:  # pragma: no cover - optional dependency
+    orjson = None
+
 
 @dataclass
 class ModelSpec:
@@ -59,11 +65,48 @@ def default_device_dir(repo_root: Path) -> Path:
     return repo_root / "NeuSight" / "scripts" / "asplos" / "data" / "device_configs"
 
 
-def load_json(path: Path) -> Dict:
-    with path.open() as f:
+@functools.lru_cache(maxsize=128)
+def _load_json_cached(path: str, mtime_ns: int) -> Dict:
+    with open(path) as f:
         return json.load(f)
 
 
+@functools.lru_cache(maxsize=128)
+def _model_spec_cached(model: str, path: str, mtime_ns: int) -> ModelSpec:
+    return ModelSpec.from_config(model, _load_json_cached(path, mtime_ns))
+
+
+def load_json(path: Path) -> Dict:
+    # Keyed on mtime so sweeps and the API server only reparse a config after
+    # it changes on disk; callers must treat the result as read-only.
+    return _load_json_cached(str(path), path.stat().st_mtime_ns)
+
+
+def dumps_json(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode("utf-8")
+
+
+def loads_json(data: bytes):
+    # Malformed input raises ValueError either way: orjson.JSONDecodeError and
+    # json.JSONDecodeError both subclass it, as does UnicodeDecodeError for
+    # bodies that are not valid UTF-8.
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def write_json(path: Path, data: Dict) -> None:
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return
+    # Indented output never uses the C encoder, so streaming into the file
+    # costs nothing and avoids holding a second full copy as one string.
+    with path.open("w") as f:
+        json.dump(data, f, indent=2)
+
+
 def list_model_names(model_dir: Path) -> List[str]:
     if not model_dir.exists():
         return []
@@ -80,8 +123,7 @@ def load_model_config(model: str, model_dir: Path) -> ModelSpec:
     path = model_dir / f"{model}.json"
     if not path.exists():
         raise FileNotFoundError(f"model config not found: {path}")
-    cfg = load_json(path)
-    return ModelSpec.from_config(model, cfg)
+    return _model_spec_cached(model, str(path), path.stat().st_mtime_ns)
 
 
 def load_device_config(gpu: str, device_dir: Path) -> Dict:
@@ -1,5 +1,8 @@
+import math
+import threading
+from dataclasses import replace
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 import torch
 
@@ -12,8 +15,12 @@ from .config import (
 )
 from .model import build_minimal_model
 from .hf_model import build_transformers_model
-from .profiler import ProfileResult, profile_model
-from .workload import build_rank_map, build_rank_steps
+from .profiler import ExtraProfile, LayerProfile, ProfileResult, profile_model
+from .workload import build_dp_groups, build_rank_map, build_rank_steps, build_rank_table
+
+# Cached transformers models are shared between calls and get moved, cast and
+# hooked while profiling, so concurrent requests generate one at a time.
+_PROFILE_LOCK = threading.Lock()
 
 
 def _parse_int(value, name: str, min_value: int = 1) -> int:
@@ -52,6 +59,35 @@ def _module_param_bytes(module: torch.nn.Module) -> int:
     return int(total)
 
 
+def _fingerprint(module: torch.nn.Module):
+    return type(module).__name__, tuple(tuple(param.shape) for param in module.parameters())
+
+
+def _representative_layers(layer_modules) -> List[int]:
+    # Structurally identical blocks are timed once, through their first instance.
+    first_by_fingerprint: Dict[tuple, int] = {}
+    return [
+        first_by_fingerprint.setdefault(_fingerprint(module), idx)
+        for idx, (_name, module) in enumerate(layer_modules)
+    ]
+
+
+def _layer_param_bytes(layer_modules) -> List[int]:
+    # profile_layers="single" repeats one module for every layer; walk its
+    # parameters once.
+    param_bytes_by_module: Dict[int, int] = {}
+    layer_bytes = []
+    for _name, module in layer_modules:
+        if id(module) not in param_bytes_by_module:
+            param_bytes_by_module[id(module)] = _module_param_bytes(module)
+        layer_bytes.append(param_bytes_by_module[id(module)])
+    return layer_bytes
+
+
+_STAGE_SUM_FIELDS = ("fw_compute_ms", "bw_compute_ms", "tp_fw_bytes", "tp_bw_bytes", "dp_bw_bytes")
+LAYER_FIELDS = _STAGE_SUM_FIELDS + ("pp_bytes",)
+
+
 def _build_stage_stats(
     layer_stats,
     prologue_stats,
@@ -60,92 +96,77 @@ def _build_stage_stats(
 ):
     if pp_degree <= 0:
         raise ValueError("pp must be >= 1")
-    if len(layer_stats) % pp_degree != 0:
+    num_layers = len(layer_stats["pp_bytes"])
+    if num_layers % pp_degree != 0:
         raise ValueError("num_layers must be divisible by pp")
-    per_stage = len(layer_stats) // pp_degree
+    per_stage = num_layers // pp_degree
     stage_stats = []
     for stage in range(pp_degree):
         start = stage * per_stage
         end = start + per_stage
-        chunk = layer_stats[start:end]
-        stage_stat = {
-            "fw_compute_ms": sum(item["fw_compute_ms"] for item in chunk),
-            "bw_compute_ms": sum(item["bw_compute_ms"] for item in chunk),
-            "tp_fw_bytes": sum(item["tp_fw_bytes"] for item in chunk),
-            "tp_bw_bytes": sum(item["tp_bw_bytes"] for item in chunk),
-            "dp_bw_bytes": sum(item["dp_bw_bytes"] for item in chunk),
-            "pp_bytes": chunk[-1]["pp_bytes"] if chunk else 0,
-        }
-        if stage == 0 and prologue_stats:
-            stage_stat["fw_compute_ms"] += prologue_stats["fw_compute_ms"]
-            stage_stat["bw_compute_ms"] += prologue_stats["bw_compute_ms"]
-            stage_stat["tp_fw_bytes"] += prologue_stats["tp_fw_bytes"]
-            stage_stat["tp_bw_bytes"] += prologue_stats["tp_bw_bytes"]
-            stage_stat["dp_bw_bytes"] += prologue_stats["dp_bw_bytes"]
-        if stage == pp_degree - 1 and epilogue_stats:
-            stage_stat["fw_compute_ms"] += epilogue_stats["fw_compute_ms"]
-            stage_stat["bw_compute_ms"] += epilogue_stats["bw_compute_ms"]
-            stage_stat["tp_fw_bytes"] += epilogue_stats["tp_fw_bytes"]
-            stage_stat["tp_bw_bytes"] += epilogue_stats["tp_bw_bytes"]
-            stage_stat["dp_bw_bytes"] += epilogue_stats["dp_bw_bytes"]
+        stage_stat = {field: sum(layer_stats[field][start:end]) for field in _STAGE_SUM_FIELDS}
+        stage_stat["pp_bytes"] = layer_stats["pp_bytes"][end - 1] if per_stage else 0
+        extras = (
+            prologue_stats if stage == 0 else None,
+            epilogue_stats if stage == pp_degree - 1 else None,
+        )
+        for extra in extras:
+            if extra:
+                for field in _STAGE_SUM_FIELDS:
+                    stage_stat[field] += extra[field]
         stage_stats.append(stage_stat)
     return stage_stats
 
 
 def _build_layer_stats(
     profile: ProfileResult,
-    layer_modules,
+    layer_param_bytes: List[int],
     mode: str,
     dp_degree: int,
     tp_degree: int,
     bytes_per_element: int,
     tp_comm_factor: float,
     time_scale: float,
-):
-    layer_stats = []
-    for layer_profile, (_name, module) in zip(profile.layers, layer_modules):
+) -> Dict[str, List]:
+    # One list per field (LAYER_FIELDS), indexed by layer, so stage sums are
+    # plain slices.
+    train = mode == "train"
+    tp_fw = tp_degree > 1
+    tp_bw = tp_fw and train
+    dp_bw = dp_degree > 1 and train
+    pp_bytes = []
+    for layer_profile in profile.layers:
         shape = layer_profile.output_shape
         if not shape:
             raise ValueError(f"missing output shape for {layer_profile.name}")
-        elems = 1
-        for dim in shape:
-            elems *= int(dim)
-        activation_bytes = int(elems * bytes_per_element)
-        param_bytes = _module_param_bytes(module)
-        tp_fw_bytes = int(activation_bytes * tp_comm_factor) if tp_degree > 1 else 0
-        tp_bw_bytes = int(activation_bytes * tp_comm_factor) if tp_degree > 1 and mode == "train" else 0
-        dp_bw_bytes = int(param_bytes) if dp_degree > 1 and mode == "train" else 0
-        scaled_fw = layer_profile.fw_ms * time_scale
-        scaled_bw = layer_profile.bw_ms * time_scale
-        layer_stats.append(
-            {
-                "fw_compute_ms": scaled_fw,
-                "bw_compute_ms": scaled_bw if mode == "train" else 0.0,
-                "tp_fw_bytes": tp_fw_bytes,
-                "tp_bw_bytes": tp_bw_bytes,
-                "dp_bw_bytes": dp_bw_bytes,
-                "pp_bytes": activation_bytes,
-            }
-        )
-    return layer_stats
+        pp_bytes.append(int(math.prod(int(dim) for dim in shape) * bytes_per_element))
+    tp_comm_bytes = [int(activation_bytes * tp_comm_factor) for activation_bytes in pp_bytes]
+    zeros = [0] * len(pp_bytes)
+    return {
+        "fw_compute_ms": [layer.fw_ms * time_scale for layer in profile.layers],
+        "bw_compute_ms": [layer.bw_ms * time_scale for layer in profile.layers] if train else [0.0] * len(pp_bytes),
+        "tp_fw_bytes": tp_comm_bytes if tp_fw else zeros,
+        "tp_bw_bytes": tp_comm_bytes if tp_bw else zeros,
+        "dp_bw_bytes": list(layer_param_bytes[: len(pp_bytes)]) if dp_bw else zeros,
+        "pp_bytes": pp_bytes,
+    }
 
 
 def _build_extra_stats(
     extra,
-    module,
+    param_bytes: Optional[int],
     mode: str,
     dp_degree: int,
     time_scale: float,
 ):
-    if extra is None or module is None:
+    if extra is None or param_bytes is None:
         return None
-    param_bytes = _module_param_bytes(module)
     return {
         "fw_compute_ms": extra.fw_ms * time_scale,
         "bw_compute_ms": extra.bw_ms * time_scale if mode == "train" else 0.0,
         "tp_fw_bytes": 0,
         "tp_bw_bytes": 0,
-        "dp_bw_bytes": int(param_bytes) if dp_degree > 1 and mode == "train" else 0,
+        "dp_bw_bytes": param_bytes if dp_degree > 1 and mode == "train" else 0,
         "pp_bytes": 0,
     }
 
@@ -172,7 +193,162 @@ def _compute_time_scale(profile_cfg: Optional[Dict], target_cfg: Optional[Dict],
     return max(comp_scale, mem_scale)
 
 
+def _roofline_ms(flops: float, mem_bytes: float, device_cfg: Dict) -> float:
+    # NeuSight device configs give SingleFLOPs in GFLOP/s and Mem_Bw in GB/s.
+    return max(flops / device_cfg["SingleFLOPs"], mem_bytes / device_cfg["Mem_Bw"]) * 1e-6
+
+
+def _analytical_profile(
+    spec,
+    batch: int,
+    seq: int,
+    mode: str,
+    bytes_per_element: int,
+    target_cfg: Dict,
+):
+    # Counts follow the minimal backend's blocks (fused qkv, out projection,
+    # two-layer MLP, two LayerNorms); backward is taken as twice the forward.
+    for key in ("SingleFLOPs", "Mem_Bw"):
+        if not target_cfg.get(key, 0) > 0:
+            raise ValueError(f"device config is missing {key}; analytical backend needs it")
+    hidden = spec.hidden_size
+    ffn = spec.ffn_hidden_size
+    tokens = batch * seq
+    train = mode == "train"
+
+    layer_params = 4 * hidden * hidden + 2 * hidden * ffn + 9 * hidden + ffn
+    layer_flops = 2 * tokens * hidden * (4 * hidden + 2 * ffn) + 4 * batch * seq * seq * hidden
+    # Weights plus each matmul's input and output, read or written once.
+    layer_bytes = (layer_params + tokens * (12 * hidden + 2 * ffn)) * bytes_per_element
+    layer_fw_ms = _roofline_ms(layer_flops, layer_bytes, target_cfg)
+    layer = LayerProfile(
+        name="layer",
+        fw_ms=layer_fw_ms,
+        bw_ms=2.0 * layer_fw_ms if train else 0.0,
+        output_shape=(batch, seq, hidden),
+    )
+
+    # Embedding gathers and the final LayerNorm are bandwidth bound.
+    prologue_params = (spec.vocab_size + spec.max_position) * hidden
+    prologue_fw_ms = _roofline_ms(tokens * hidden, 3 * tokens * hidden * bytes_per_element, target_cfg)
+    epilogue_params = 2 * hidden
+    epilogue_fw_ms = _roofline_ms(5 * tokens * hidden, 2 * tokens * hidden * bytes_per_element, target_cfg)
+    profile = ProfileResult(
+        layers=[layer] * spec.num_layers,
+        prologue=ExtraProfile("prologue", prologue_fw_ms, 2.0 * prologue_fw_ms if train else 0.0),
+        epilogue=ExtraProfile("epilogue", epilogue_fw_ms, 2.0 * epilogue_fw_ms if train else 0.0),
+    )
+    return (
+        profile,
+        [layer_params * bytes_per_element] * spec.num_layers,
+        prologue_params * bytes_per_element,
+        epilogue_params * bytes_per_element,
+    )
+
+
+def _build_profile_model(
+    model: str,
+    spec,
+    model_dir: Path,
+    model_backend: str,
+    build_layers: Optional[int],
+    device: torch.device,
+    dtype: torch.dtype,
+):
+    if model_backend == "transformers":
+        model_path = model_dir / f"{model}.json"
+        model_torch, layer_modules, prologue_modules, epilogue_modules = build_transformers_model(
+            str(model_path), num_layers=build_layers, device=str(device)
+        )
+    elif model_backend == "minimal":
+        with device:
+            model_torch = build_minimal_model(replace(spec, num_layers=build_layers) if build_layers else spec)
+        layer_modules = [(f"layer_{idx}", layer) for idx, layer in enumerate(model_torch.layers)]
+        prologue_modules = [("prologue", model_torch.prologue)]
+        epilogue_modules = [("epilogue", model_torch.epilogue)]
+    else:
+        raise ValueError(f"unknown model_backend: {model_backend}")
+
+    model_torch = model_torch.to(device=device, dtype=dtype)
+
+    if not layer_modules:
+        raise RuntimeError("no transformer layers found for profiling")
+    return model_torch, layer_modules, prologue_modules, epilogue_modules
+
+
+def _compile_layers(layer_modules) -> None:
+    # Only forward is swapped, so the module-level timing hooks stay outside the
+    # compiled graph. Default Inductor mode: no CUDA graphs, as hooks do not
+    # fire on replay. The first warmup step pays for compilation.
+    for _name, layer in layer_modules:
+        layer.forward = torch.compile(layer.forward)
+
+
+def _uncompile_layers(layer_modules) -> None:
+    # Built models are cached across requests (and within generate_workloads)
+    # without regard to compile, so restore the eager forward after profiling.
+    for _name, layer in layer_modules:
+        if "forward" in vars(layer):
+            del layer.forward
+
+
+def _detect_profile_gpu(payload: Dict, device: torch.device, gpu: str, device_dir: Path):
+    profile_gpu = payload.get("profile_gpu")
+    profile_cfg = None
+    if device.type == "cuda" and torch.cuda.is_available():
+        try:
+            index = device.index if device.index is not None else 0
+            detected = torch.cuda.get_device_name(index)
+            if detected:
+                profile_gpu = detected.replace(" ", "_")
+        except Exception:
+            profile_gpu = profile_gpu
+    if not profile_gpu:
+        profile_gpu = gpu
+    if profile_gpu:
+        try:
+            profile_cfg = load_device_config(str(profile_gpu), device_dir)
+        except FileNotFoundError:
+            profile_cfg = None
+    return profile_gpu, profile_cfg
+
+
 def generate_workload(payload: Dict, repo_root: Optional[str] = None) -> Dict:
+    with _PROFILE_LOCK:
+        return _generate_workload(payload, repo_root)
+
+
+_BATCH_SHARED_KEYS = ("model", "gpu", "dtype", "device", "model_backend")
+
+
+def generate_workloads(payloads: List[Dict], repo_root: Optional[str] = None) -> List[Dict]:
+    # Sweep entry point: payloads differ only in shape/parallelism, so the model
+    # is built and moved to the device once and only profiling is repeated.
+    if not payloads:
+        return []
+    shared = [payloads[0].get(key) for key in _BATCH_SHARED_KEYS]
+    for payload in payloads[1:]:
+        if [payload.get(key) for key in _BATCH_SHARED_KEYS] != shared:
+            raise ValueError(f"payloads must share {', '.join(_BATCH_SHARED_KEYS)}")
+    cache: Dict[tuple, object] = {}
+    with _PROFILE_LOCK:
+        return [_generate_workload(payload, repo_root, cache) for payload in payloads]
+
+
+def _input_ids(vocab_size: int, shape, device: torch.device, cache: Optional[Dict]) -> torch.Tensor:
+    # Batched sweeps draw every config's ids from one device buffer, grown only
+    # when a larger shape comes along, instead of a fresh allocation each.
+    numel = math.prod(shape)
+    key = ("input_ids", str(device))
+    buffer = cache.get(key) if cache is not None else None
+    if buffer is None or buffer.numel() < numel:
+        buffer = torch.empty(numel, dtype=torch.long, device=device)
+        if cache is not None:
+            cache[key] = buffer
+    return buffer[:numel].view(shape).random_(0, vocab_size)
+
+
+def _generate_workload(payload: Dict, repo_root: Optional[str], cache: Optional[Dict] = None) -> Dict:
     model = str(payload.get("model") or "").strip()
     gpu = str(payload.get("gpu") or "").strip()
     mode = str(payload.get("mode") or "train").strip()
@@ -187,6 +363,8 @@ def generate_workload(payload: Dict, repo_root: Optional[str] = None) -> Dict:
     device_name = str(payload.get("device") or "cuda").strip()
     device_scale_mode = str(payload.get("device_scale_mode") or "max").strip().lower()
     model_backend = str(payload.get("model_backend") or "transformers").strip().lower()
+    profile_layers = str(payload.get("profile_layers") or "all").strip().lower()
+    compile_layers = bool(payload.get("compile"))
     warmup_steps = _parse_int(payload.get("warmup_steps", 1), "warmup_steps", min_value=0)
     measure_steps = _parse_int(payload.get("measure_steps", 1), "measure_steps", min_value=1)
     tp_comm_factor = _parse_float(payload.get("tp_comm_factor", 2.0), "tp_comm_factor")
@@ -197,6 +375,8 @@ def generate_workload(payload: Dict, repo_root: Optional[str] = None) -> Dict:
         raise ValueError("gpu is required")
     if mode not in ("train", "inf"):
         raise ValueError("mode must be train or inf")
+    if profile_layers not in ("all", "single"):
+        raise ValueError("profile_layers must be all or single")
 
     repo_root_path = resolve_repo_root(repo_root)
     model_dir = Path(payload.get("model_dir") or default_model_dir(repo_root_path))
@@ -218,80 +398,80 @@ def generate_workload(payload: Dict, repo_root: Optional[str] = None) -> Dict:
         raise ValueError("num_layers must be divisible by pp")
 
     dtype = _dtype_from_name(dtype_name)
-    device = torch.device(device_name)
-    if device.type == "cuda" and not torch.cuda.is_available():
-        raise RuntimeError("cuda is not available on this host")
-    if device.type == "cpu" and dtype in (torch.float16, torch.bfloat16):
-        raise RuntimeError("fp16/bf16 profiling on cpu is not supported")
-
-    if model_backend == "transformers":
-        model_path = model_dir / f"{model}.json"
-        model_torch, layer_modules, prologue_modules, epilogue_modules = build_transformers_model(
-            str(model_path)
+    bytes_per_element = torch.finfo(dtype).bits // 8
+    need_param_bytes = dp_degree > 1 and mode == "train"
+    if model_backend == "analytical":
+        # No model is built or run; timings are estimated for the target GPU.
+        profile, layer_param_bytes, prologue_param_bytes, epilogue_param_bytes = _analytical_profile(
+            spec, profile_batch, seq, mode, bytes_per_element, target_cfg
         )
-    elif model_backend == "minimal":
-        model_torch = build_minimal_model(spec)
-        layer_modules = [(f"layer_{idx}", layer) for idx, layer in enumerate(model_torch.layers)]
-        prologue_modules = [("prologue", model_torch.prologue)]
-        epilogue_modules = [("epilogue", model_torch.epilogue)]
-    else:
-        raise ValueError(f"unknown model_backend: {model_backend}")
-
-    model_torch = model_torch.to(device=device, dtype=dtype)
-    model_torch.train(mode == "train")
-
-    if not layer_modules:
-        raise RuntimeError("no transformer layers found for profiling")
-    prologue_module = prologue_modules[0][1] if prologue_modules else None
-    epilogue_module = epilogue_modules[0][1] if epilogue_modules else None
-
-    input_ids = torch.randint(
-        0,
-        spec.vocab_size,
-        (profile_batch, seq),
-        device=device,
-        dtype=torch.long,
-    )
-
-    profile = profile_model(
-        model=model_torch,
-        input_ids=input_ids,
-        layer_modules=layer_modules,
-        prologue_modules=prologue_modules,
-        epilogue_modules=epilogue_modules,
-        mode=mode,
-        warmup_steps=warmup_steps,
-        measure_steps=measure_steps,
-    )
-
-    profile_gpu = payload.get("profile_gpu")
-    profile_cfg = None
-    if device.type == "cuda" and torch.cuda.is_available():
-        try:
-            index = device.index if device.index is not None else 0
-            detected = torch.cuda.get_device_name(index)
-            if detected:
-                profile_gpu = detected.replace(" ", "_")
-        except Exception:
-            profile_gpu = profile_gpu
-    if not profile_gpu:
         profile_gpu = gpu
-    if profile_gpu:
-        try:
-            profile_cfg = load_device_config(str(profile_gpu), device_dir)
-        except FileNotFoundError:
-            profile_cfg = None
-    if device.type != "cuda":
         device_scale_mode = "none"
+        time_scale = 1.0
+    else:
+        device = torch.device(device_name)
+        if device.type == "cuda" and not torch.cuda.is_available():
+            raise RuntimeError("cuda is not available on this host")
+        if device.type == "cpu" and dtype in (torch.float16, torch.bfloat16):
+            raise RuntimeError("fp16/bf16 profiling on cpu is not supported")
+
+        # "single" builds and times one block and reuses it for every layer, which
+        # assumes the layers are homogeneous (true for the supported models).
+        build_layers = 1 if profile_layers == "single" else None
+        model_key = (model, str(model_dir), model_backend, build_layers, str(device), dtype)
+        built = cache.get(model_key) if cache is not None else None
+        if built is None:
+            built = _build_profile_model(model, spec, model_dir, model_backend, build_layers, device, dtype)
+            if cache is not None:
+                cache[model_key] = built
+        model_torch, layer_modules, prologue_modules, epilogue_modules = built
+        model_torch.train(mode == "train")
+        if compile_layers:
+            _compile_layers(layer_modules)
+
+        input_ids = _input_ids(spec.vocab_size, (profile_batch, seq), device, cache)
 
-    time_scale = 1.0
-    if device_scale_mode not in ("none", "off"):
-        time_scale = _compute_time_scale(profile_cfg, target_cfg, device_scale_mode)
+        try:
+            profile = profile_model(
+                model=model_torch,
+                input_ids=input_ids,
+                layer_modules=layer_modules,
+                prologue_modules=prologue_modules,
+                epilogue_modules=epilogue_modules,
+                mode=mode,
+                warmup_steps=warmup_steps,
+                measure_steps=measure_steps,
+                representatives=_representative_layers(layer_modules),
+            )
+        finally:
+            if compile_layers:
+                _uncompile_layers(layer_modules)
+        if profile_layers == "single":
+            profile.layers = profile.layers[:1] * spec.num_layers
+            layer_modules = layer_modules[:1] * spec.num_layers
+
+        if need_param_bytes:
+            layer_param_bytes = _layer_param_bytes(layer_modules)
+        else:
+            layer_param_bytes = [0] * len(layer_modules)
+        prologue_param_bytes = None
+        epilogue_param_bytes = None
+        if prologue_modules:
+            prologue_param_bytes = _module_param_bytes(prologue_modules[0][1]) if need_param_bytes else 0
+        if epilogue_modules:
+            epilogue_param_bytes = _module_param_bytes(epilogue_modules[0][1]) if need_param_bytes else 0
+
+        profile_gpu, profile_cfg = _detect_profile_gpu(payload, device, gpu, device_dir)
+        if device.type != "cuda":
+            device_scale_mode = "none"
+
+        time_scale = 1.0
+        if device_scale_mode not in ("none", "off"):
+            time_scale = _compute_time_scale(profile_cfg, target_cfg, device_scale_mode)
 
-    bytes_per_element = torch.tensor([], dtype=dtype).element_size()
     layer_stats = _build_layer_stats(
         profile=profile,
-        layer_modules=layer_modules,
+        layer_param_bytes=layer_param_bytes,
         mode=mode,
         dp_degree=dp_degree,
         tp_degree=tp_degree,
@@ -299,17 +479,21 @@ def generate_workload(payload: Dict, repo_root: Optional[str] = None) -> Dict:
         tp_comm_factor=tp_comm_factor,
         time_scale=time_scale,
     )
-    prologue_stats = _build_extra_stats(profile.prologue, prologue_module, mode, dp_degree, time_scale)
-    epilogue_stats = _build_extra_stats(profile.epilogue, epilogue_module, mode, dp_degree, time_scale)
+    prologue_stats = _build_extra_stats(profile.prologue, prologue_param_bytes, mode, dp_degree, time_scale)
+    epilogue_stats = _build_extra_stats(profile.epilogue, epilogue_param_bytes, mode, dp_degree, time_scale)
 
     stage_stats = _build_stage_stats(layer_stats, prologue_stats, epilogue_stats, pp_degree)
 
     microbatches = max(1, pp_microbatch)
+    rank_table = build_rank_table(dp_degree, pp_degree, tp_degree)
+    dp_groups = build_dp_groups(rank_table)
     ranks = []
-    for rank_info in build_rank_map(dp_degree, pp_degree, tp_degree):
+    for rank_info in build_rank_map(rank_table):
         steps = build_rank_steps(
             rank_info,
             stage_stats,
+            rank_table,
+            dp_groups,
             dp_degree,
             pp_degree,
             tp_degree,
@@ -369,6 +553,8 @@ def generate_workload(payload: Dict, repo_root: Optional[str] = None) -> Dict:
                 "profile_gpu": profile_gpu,
                 "target_gpu": gpu,
                 "model_backend": model_backend,
+                "profile_layers": profile_layers,
+                "compile": compile_layers,
             },
             "parallel": {
                 "dp": dp_degree,
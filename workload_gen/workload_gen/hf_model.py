@@ -1,4 +1,8 @@
-from typing import List, Tuple
+import contextlib
+import functools
+import operator
+import os
+from typing import List, Optional, Tuple
 
 try:
     from transformers import AutoConfig, AutoModel
@@ -9,39 +13,56 @@ except Exception:  # pragma: no cover - optional dependency
 import torch
 
 
-def _get_attr_path(obj, path: str):
-    current = obj
-    for part in path.split("."):
-        if not hasattr(current, part):
-            return None
-        current = getattr(current, part)
-    return current
+_LAYER_PATHS = (
+    "encoder.layer",
+    "h",
+    "decoder.layers",
+    "transformer.h",
+    "model.layers",
+    "layers",
+)
+_LAYER_GETTERS = tuple((path, operator.attrgetter(path)) for path in _LAYER_PATHS)
 
 
 def _resolve_layers(model) -> List[Tuple[str, torch.nn.Module]]:
-    candidates = [
-        "encoder.layer",
-        "h",
-        "decoder.layers",
-        "transformer.h",
-        "model.layers",
-        "layers",
-    ]
-    for path in candidates:
-        layers = _get_attr_path(model, path)
+    for path, getter in _LAYER_GETTERS:
+        try:
+            layers = getter(model)
+        except AttributeError:
+            continue
         if isinstance(layers, torch.nn.ModuleList):
             return [(f"{path}.{idx}", layer) for idx, layer in enumerate(layers)]
     raise ValueError("unable to locate transformer layers in model")
 
 
-def build_transformers_model(config_path: str):
+def build_transformers_model(config_path: str, num_layers: Optional[int] = None, device: Optional[str] = None):
     if AutoConfig is None or AutoModel is None:
         raise ImportError("transformers is not installed")
+    # Sweeps reuse the same instantiated model; the lists are copied so callers
+    # can reshape them without touching the cache.
+    model, layer_modules, prologue_modules, epilogue_modules = _build_transformers_model_cached(
+        config_path, os.path.getmtime(config_path), num_layers, device
+    )
+    return model, list(layer_modules), list(prologue_modules), list(epilogue_modules)
 
+
+@functools.lru_cache(maxsize=2)
+def _build_transformers_model_cached(
+    config_path: str,
+    _mtime: float,
+    num_layers: Optional[int],
+    device: Optional[str],
+):
     cfg = AutoConfig.from_pretrained(config_path)
     if hasattr(cfg, "use_cache"):
         cfg.use_cache = False
-    model = AutoModel.from_config(cfg)
+    if num_layers is not None:
+        # attribute_map routes this to n_layer etc. on configs that rename it.
+        cfg.num_hidden_layers = num_layers
+    # Creating the weights on the target device skips a host copy of every
+    # parameter and the host-to-device transfer.
+    with torch.device(device) if device else contextlib.nullcontext():
+        model = AutoModel.from_config(cfg)
 
     layer_modules = _resolve_layers(model)
     prologue_modules = []
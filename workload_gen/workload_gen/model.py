@@ -1,8 +1,8 @@
 from dataclasses import dataclass
-from typing import Optional
 
 import torch
 from torch import nn
+from torch.nn import functional as F
 
 from .config import ModelSpec
 
@@ -13,11 +13,12 @@ class EmbeddingLayer(nn.Module):
         self.token_embed = nn.Embedding(vocab_size, hidden_size)
         self.pos_embed = nn.Embedding(max_position, hidden_size)
         self.dropout = nn.Dropout(dropout)
+        # Built once; each forward takes a view instead of a new arange.
+        self.register_buffer("positions", torch.arange(max_position).unsqueeze(0), persistent=False)
 
     def forward(self, input_ids: torch.Tensor) -> torch.Tensor:
         seq_len = input_ids.shape[1]
-        positions = torch.arange(seq_len, device=input_ids.device).unsqueeze(0)
-        positions = positions.expand(input_ids.shape[0], seq_len)
+        positions = self.positions[:, :seq_len].expand(input_ids.shape[0], seq_len)
         x = self.token_embed(input_ids) + self.pos_embed(positions)
         return self.dropout(x)
 
@@ -32,9 +33,16 @@ class TransformerBlock(nn.Module):
         is_causal: bool,
     ):
         super().__init__()
+        if hidden_size % num_heads != 0:
+            raise ValueError("hidden_size must be divisible by num_heads")
         self.is_causal = is_causal
+        self.num_heads = num_heads
+        self.attn_dropout = dropout
         self.ln1 = nn.LayerNorm(hidden_size)
-        self.attn = nn.MultiheadAttention(hidden_size, num_heads, dropout=dropout, batch_first=True)
+        # Same parameters as nn.MultiheadAttention, but attention runs through
+        # scaled_dot_product_attention so the fused kernels can be used.
+        self.qkv = nn.Linear(hidden_size, 3 * hidden_size)
+        self.out_proj = nn.Linear(hidden_size, hidden_size)
         self.ln2 = nn.LayerNorm(hidden_size)
         self.mlp = nn.Sequential(
             nn.Linear(hidden_size, ffn_hidden_size),
@@ -42,11 +50,21 @@ class TransformerBlock(nn.Module):
             nn.Linear(ffn_hidden_size, hidden_size),
         )
 
-    def forward(self, x: torch.Tensor, attn_mask: Optional[torch.Tensor]) -> torch.Tensor:
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
         residual = x
         x = self.ln1(x)
-        attn_out, _ = self.attn(x, x, x, attn_mask=attn_mask, need_weights=False)
-        x = residual + attn_out
+        batch, seq_len, hidden = x.shape
+        qkv = self.qkv(x).view(batch, seq_len, 3, self.num_heads, hidden // self.num_heads)
+        q, k, v = qkv.permute(2, 0, 3, 1, 4)
+        attn_out = F.scaled_dot_product_attention(
+            q,
+            k,
+            v,
+            dropout_p=self.attn_dropout if self.training else 0.0,
+            is_causal=self.is_causal,
+        )
+        attn_out = attn_out.transpose(1, 2).reshape(batch, seq_len, hidden)
+        x = residual + self.out_proj(attn_out)
         residual = x
         x = self.ln2(x)
         x = self.mlp(x)
@@ -84,13 +102,8 @@ class TransformerModel(nn.Module):
                 f"sequence length {input_ids.shape[1]} exceeds max_position {self.spec.max_position}"
             )
         x = self.prologue(input_ids)
-        attn_mask = None
-        if self.is_causal:
-            seq_len = input_ids.shape[1]
-            mask = torch.triu(torch.ones(seq_len, seq_len, device=input_ids.device), diagonal=1)
-            attn_mask = mask.bool()
         for layer in self.layers:
-            x = layer(x, attn_mask=attn_mask)
+            x = layer(x)
         return self.epilogue(x)
 
 
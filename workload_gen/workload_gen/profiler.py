@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+import functools
 import time
 from typing import Dict, Iterable, List, Optional, Tuple
 
@@ -35,6 +36,7 @@ class ModuleTimer:
         self.fw_ms: Dict[str, float] = {}
         self.bw_ms: Dict[str, float] = {}
         self.output_shapes: Dict[str, Tuple[int, ...]] = {}
+        self._pending: List[Tuple[Dict[str, float], str, object, object]] = []
 
     def reset(self) -> None:
         self._fw_start.clear()
@@ -42,6 +44,7 @@ class ModuleTimer:
         self.fw_ms.clear()
         self.bw_ms.clear()
         self.output_shapes.clear()
+        self._pending.clear()
 
     def _start(self, store: Dict[str, object], name: str) -> None:
         if self.use_cuda:
@@ -58,12 +61,20 @@ class ModuleTimer:
         if self.use_cuda:
             end = torch.cuda.Event(enable_timing=True)
             end.record()
-            torch.cuda.synchronize()
-            elapsed = start.elapsed_time(end)
-        else:
-            elapsed = (time.perf_counter() - start) * 1000.0
+            # Resolved in flush(), so the GPU is synced once rather than per module.
+            self._pending.append((acc, name, start, end))
+            return
+        elapsed = (time.perf_counter() - start) * 1000.0
         acc[name] = acc.get(name, 0.0) + float(elapsed)
 
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        torch.cuda.synchronize()
+        for acc, name, start, end in self._pending:
+            acc[name] = acc.get(name, 0.0) + float(start.elapsed_time(end))
+        self._pending.clear()
+
     def start_fw(self, name: str) -> None:
         self._start(self._fw_start, name)
 
@@ -105,6 +116,12 @@ def _extract_tensor(output: object) -> Optional[torch.Tensor]:
     return None
 
 
+def _stash_input(stash: Dict[str, torch.Tensor], key: str, _module, args, kwargs) -> None:
+    tensor = args[0] if args else kwargs.get("hidden_states")
+    if isinstance(tensor, torch.Tensor):
+        stash[key] = tensor
+
+
 def _attach_hooks(
     timer: ModuleTimer,
     modules: Iterable[Tuple[str, torch.nn.Module]],
@@ -146,11 +163,51 @@ def profile_model(
     mode: str,
     warmup_steps: int,
     measure_steps: int,
+    representatives: Optional[List[int]] = None,
 ) -> ProfileResult:
+    # representatives[i] is the index of the layer whose timings layer i reuses;
+    # only those layers are hooked and timed.
+    if representatives is None:
+        representatives = list(range(len(layer_modules)))
     use_cuda = input_ids.is_cuda
     timer = ModuleTimer(use_cuda=use_cuda)
-    all_modules = prologue_modules + layer_modules + epilogue_modules
-    handles = _attach_hooks(timer, all_modules, mode)
+    timed_layers = [entry for idx, entry in enumerate(layer_modules) if representatives[idx] == idx]
+    all_modules = prologue_modules + timed_layers + epilogue_modules
+
+    # Only timed layers need a backward. Past the deepest timed layer, the
+    # epilogue is backpropagated down to its own input and parameters (so its
+    # weight-grad kernels are still timed) and the body is seeded at the next
+    # layer's input, so the layers in between are skipped. Inputs are stashed
+    # from pre-hooks on the following module so they carry the timed layers'
+    # full-backward-hook wrappers.
+    cut = max(representatives, default=-1) + 1
+    truncate = mode == "train" and 0 < cut < len(layer_modules)
+    stash: Dict[str, torch.Tensor] = {}
+    stash_handles: List[torch.utils.hooks.RemovableHandle] = []
+    epilogue_params: List[torch.Tensor] = []
+    if truncate:
+        stash_handles.append(
+            layer_modules[cut][1].register_forward_pre_hook(
+                functools.partial(_stash_input, stash, "cut"), with_kwargs=True
+            )
+        )
+        if epilogue_modules:
+            epilogue_params = [param for param in epilogue_modules[0][1].parameters() if param.requires_grad]
+            stash_handles.append(
+                epilogue_modules[0][1].register_forward_pre_hook(
+                    functools.partial(_stash_input, stash, "epilogue"), with_kwargs=True
+                )
+            )
+
+    # Same gradient as backpropagating tensor.sum(), without a float32 copy
+    # and reduction per step; shapes are fixed, so reuse them.
+    ones: Dict[Tuple, torch.Tensor] = {}
+
+    def ones_like(tensor: torch.Tensor) -> torch.Tensor:
+        key = (tuple(tensor.shape), tensor.dtype, tensor.device)
+        if key not in ones:
+            ones[key] = torch.ones_like(tensor)
+        return ones[key]
 
     def run_once() -> None:
         model.zero_grad(set_to_none=True)
@@ -159,36 +216,48 @@ def profile_model(
             tensor = _extract_tensor(output)
             if tensor is None:
                 raise RuntimeError("unable to extract tensor output for backward")
-            loss = tensor.float().sum()
-            loss.backward()
+            cut_input = stash.pop("cut", None)
+            epilogue_input = stash.pop("epilogue", None)
+            if cut_input is not None:
+                if epilogue_input is not None:
+                    torch.autograd.backward(
+                        tensor, ones_like(tensor), inputs=[epilogue_input, *epilogue_params]
+                    )
+                cut_input.backward(ones_like(cut_input))
+            else:
+                tensor.backward(ones_like(tensor))
         else:
-            with torch.no_grad():
+            with torch.inference_mode():
                 _ = model(input_ids)
 
+    handles: List[torch.utils.hooks.RemovableHandle] = []
     try:
+        # Warmup timings are discarded anyway, so timing hooks only go on for
+        # the measured steps.
         for _ in range(max(0, warmup_steps)):
             run_once()
-        timer.reset()
+        handles = _attach_hooks(timer, all_modules, mode)
         for _ in range(max(1, measure_steps)):
             run_once()
+        timer.flush()
         if measure_steps > 1:
             for name in list(timer.fw_ms.keys()):
                 timer.fw_ms[name] = timer.fw_ms[name] / measure_steps
             for name in list(timer.bw_ms.keys()):
                 timer.bw_ms[name] = timer.bw_ms[name] / measure_steps
     finally:
-        for handle in handles:
+        for handle in stash_handles + handles:
             handle.remove()
 
     layers: List[LayerProfile] = []
-    for name, _module in layer_modules:
-        shape = timer.output_shapes.get(name, ())
+    for (name, _module), source in zip(layer_modules, representatives):
+        timed = layer_modules[source][0]
         layers.append(
             LayerProfile(
                 name=name,
-                fw_ms=timer.fw_ms.get(name, 0.0),
-                bw_ms=timer.bw_ms.get(name, 0.0),
-                output_shape=shape,
+                fw_ms=timer.fw_ms.get(timed, 0.0),
+                bw_ms=timer.bw_ms.get(timed, 0.0),
+                output_shape=timer.output_shapes.get(timed, ()),
             )
         )
 
@@ -1,31 +1,162 @@
 import argparse
+import gzip
+import hashlib
 import json
+import multiprocessing
 import re
 import sys
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 
-from .config import default_device_dir, default_model_dir, list_gpu_names, list_model_names, resolve_repo_root
+from .config import (
+    default_device_dir,
+    default_model_dir,
+    dumps_json,
+    list_gpu_names,
+    list_model_names,
+    loads_json,
+    resolve_repo_root,
+)
 from .generator import generate_workload
 
 
 def _json_response(handler: BaseHTTPRequestHandler, code: int, payload: dict) -> None:
-    data = json.dumps(payload).encode("utf-8")
+    _send_json_bytes(handler, code, dumps_json(payload))
+
+
+# Workload responses are megabytes of repetitive JSON; small ones are not
+# worth compressing.
+_GZIP_MIN_BYTES = 64 * 1024
+
+
+def _accepts_gzip(handler: BaseHTTPRequestHandler) -> bool:
+    for part in handler.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        if coding.strip().lower() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+def _send_json_bytes(handler: BaseHTTPRequestHandler, code: int, data: bytes) -> None:
+    compress = len(data) >= _GZIP_MIN_BYTES and _accepts_gzip(handler)
+    if compress:
+        data = gzip.compress(data, compresslevel=1)
     handler.send_response(code)
     handler.send_header("Content-Type", "application/json")
+    if compress:
+        handler.send_header("Content-Encoding", "gzip")
+        handler.send_header("Vary", "Accept-Encoding")
     handler.send_header("Content-Length", str(len(data)))
     handler.send_header("Access-Control-Allow-Origin", "*")
     handler.end_headers()
     handler.wfile.write(data)
 
 
+# Listing key -> (directory mtime, encoded response). The UI polls these;
+# the directories only change when configs are added or removed.
+_LISTING_CACHE: Dict[str, Tuple[Optional[int], bytes]] = {}
+
+
+def _listing_bytes(key: str, directory: Path, lister: Callable[[Path], List[str]]) -> bytes:
+    try:
+        mtime = directory.stat().st_mtime_ns
+    except OSError:
+        mtime = None
+    cached = _LISTING_CACHE.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    data = dumps_json({"ok": True, key: lister(directory)})
+    _LISTING_CACHE[key] = (mtime, data)
+    return data
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_UNSAFE_FILENAME_RE = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def _mtime_ns(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+class _ResponseCache:
+    # LRU of encoded /api/workload responses keyed by the canonicalized payload;
+    # identical requests from the UI skip generation entirely. Each entry keeps
+    # the mtimes of the config files its generation read and is dropped once any
+    # of them changes. Bounded by total bytes since a single workload can be
+    # tens of MB.
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[bytes, Tuple[List[Tuple[Path, Optional[int]]], bytes]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(payload) -> bytes:
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        return hashlib.blake2b(canonical, digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        deps, data = entry
+        if any(_mtime_ns(path) != mtime for path, mtime in deps):
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                    self._size -= len(data)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return data
+
+    def put(self, key: bytes, deps: List[Path], data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        entry = ([(path, _mtime_ns(path)) for path in deps], data)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+            self._entries[key] = entry
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _key, (_deps, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+def _config_paths(payload: dict, workload: dict, repo_root) -> List[Path]:
+    # The config files generate_workload read for this payload, resolved the way
+    # it resolves them.
+    root = resolve_repo_root(repo_root)
+    model_dir = Path(payload.get("model_dir") or default_model_dir(root))
+    device_dir = Path(payload.get("device_dir") or default_device_dir(root))
+    profile = (workload.get("meta") or {}).get("profile") or {}
+    paths = [
+        model_dir / f"{str(payload.get('model') or '').strip()}.json",
+        device_dir / f"{str(payload.get('gpu') or '').strip()}.json",
+    ]
+    if profile.get("profile_gpu"):
+        paths.append(device_dir / f"{profile['profile_gpu']}.json")
+    return paths
+
+
 def _slugify(value: str) -> str:
-    value = re.sub(r"\s+", "_", value.strip())
-    return re.sub(r"[^A-Za-z0-9._-]", "_", value)
+    return _UNSAFE_FILENAME_RE.sub("_", _WHITESPACE_RE.sub("_", value.strip()))
 
 
-def _save_workload(workload: dict, repo_root) -> str:
+def _encode_workload(workload: dict, repo_root) -> Tuple[Path, bytes]:
     if repo_root:
         base_dir = Path(repo_root) / "viz" / "workloads"
     else:
@@ -43,26 +174,41 @@ def _save_workload(workload: dict, repo_root) -> str:
     stamp = int(time.time() * 1000)
     filename = f"{model}-{mode}-seq{seq}-bs{batch}-dp{dp}-tp{tp}-pp{pp}-{stamp}.json"
     path = base_dir / filename
-    path.write_text(json.dumps(workload, indent=2))
-    return str(path)
+    if workload.get("meta") is None:
+        workload["meta"] = {}
+    workload["meta"]["source"] = str(path)
+    # Encoded once: the same bytes are saved and embedded in the response.
+    return path, dumps_json(workload)
+
+
+def _make_executor(workers: int) -> ProcessPoolExecutor:
+    # spawn: forked children cannot use CUDA once the parent has touched it.
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
 
 
 class Handler(BaseHTTPRequestHandler):
+    # Keep-alive: every response carries Content-Length, so polling clients
+    # (the viz dev proxy) reuse one connection instead of reconnecting per call.
+    protocol_version = "HTTP/1.1"
     config = {
         "repo_root": None,
         "model_dir": None,
         "device_dir": None,
     }
+    executor = None
+    executor_workers = 1
+    executor_lock = threading.Lock()
+    response_cache: Optional[_ResponseCache] = None
 
     def do_GET(self) -> None:
         if self.path == "/api/health":
             _json_response(self, 200, {"ok": True})
             return
         if self.path == "/api/models":
-            _json_response(self, 200, {"ok": True, "models": list_model_names(self.config["model_dir"])})
+            _send_json_bytes(self, 200, _listing_bytes("models", self.config["model_dir"], list_model_names))
             return
         if self.path == "/api/gpus":
-            _json_response(self, 200, {"ok": True, "gpus": list_gpu_names(self.config["device_dir"])})
+            _send_json_bytes(self, 200, _listing_bytes("gpus", self.config["device_dir"], list_gpu_names))
             return
         _json_response(self, 404, {"ok": False, "error": "not found"})
 
@@ -71,35 +217,72 @@ class Handler(BaseHTTPRequestHandler):
         self.send_header("Access-Control-Allow-Origin", "*")
         self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
         self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        self.send_header("Content-Length", "0")
         self.end_headers()
 
     def do_POST(self) -> None:
+        # Drain the body first so a kept-alive connection stays in sync.
+        length = int(self.headers.get("Content-Length", "0"))
+        body = self.rfile.read(length)
         if self.path != "/api/workload":
             _json_response(self, 404, {"ok": False, "error": "not found"})
             return
-        length = int(self.headers.get("Content-Length", "0"))
-        body = self.rfile.read(length)
         try:
-            payload = json.loads(body.decode("utf-8"))
-        except json.JSONDecodeError:
+            payload = loads_json(body)
+        except ValueError:
             _json_response(self, 400, {"ok": False, "error": "invalid json"})
             return
+        cache_key = None
+        if self.response_cache is not None and isinstance(payload, dict):
+            cache_key = self.response_cache.key(payload)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                _send_json_bytes(self, 200, cached)
+                return
         start = time.time()
+        executor = self.executor
         try:
-            workload = generate_workload(payload, repo_root=self.config["repo_root"])
+            if executor is not None:
+                workload = executor.submit(generate_workload, payload, self.config["repo_root"]).result()
+            else:
+                workload = generate_workload(payload, repo_root=self.config["repo_root"])
+        except BrokenProcessPool as exc:
+            # A worker died (OOM, CUDA abort); the pool is unusable from here on,
+            # so swap in a fresh one for the requests that follow.
+            self._replace_executor(executor)
+            _json_response(self, 500, {"ok": False, "error": f"generator process died: {exc}"})
+            return
         except Exception as exc:
             _json_response(self, 400, {"ok": False, "error": str(exc)})
             return
-        path = _save_workload(workload, self.config["repo_root"])
-        if "meta" not in workload or workload["meta"] is None:
-            workload["meta"] = {}
-        workload["meta"]["source"] = path
+        path, data = _encode_workload(workload, self.config["repo_root"])
+        # Save before responding so the returned path already exists; a failed
+        # save still returns the workload, just without a path (and uncached).
+        try:
+            path.write_bytes(data)
+        except OSError as exc:
+            sys.stderr.write(f"failed to save {path}: {exc}\n")
+            elapsed_ms = int((time.time() - start) * 1000)
+            response = b'{"ok":true,"elapsed_ms":%d,"save_error":%s,"workload":%s}' % (
+                elapsed_ms,
+                dumps_json(f"failed to save {path}: {exc}"),
+                data,
+            )
+            _send_json_bytes(self, 200, response)
+            return
         elapsed_ms = int((time.time() - start) * 1000)
-        _json_response(
-            self,
-            200,
-            {"ok": True, "elapsed_ms": elapsed_ms, "path": path, "workload": workload},
-        )
+        response = b'{"ok":true,"elapsed_ms":%d,"path":%s,"workload":%s}' % (elapsed_ms, dumps_json(str(path)), data)
+        if cache_key is not None:
+            self.response_cache.put(cache_key, _config_paths(payload, workload, self.config["repo_root"]), response)
+        _send_json_bytes(self, 200, response)
+
+    @classmethod
+    def _replace_executor(cls, broken: ProcessPoolExecutor) -> None:
+        with cls.executor_lock:
+            # Concurrent requests on the same broken pool rebuild it only once.
+            if cls.executor is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                cls.executor = _make_executor(cls.executor_workers)
 
     def log_message(self, fmt: str, *args) -> None:
         sys.stderr.write("%s - - [%s] %s\n" % (self.client_address[0], self.log_date_time_string(), fmt % args))
@@ -112,6 +295,20 @@ def main() -> int:
     parser.add_argument("--repo-root", default=None)
     parser.add_argument("--model-dir", default=None)
     parser.add_argument("--device-dir", default=None)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Generator processes; >1 runs requests in parallel (best for the analytical backend, "
+        "GPU profiles contend for the device). Default 1 generates in-process with cached models.",
+    )
+    parser.add_argument(
+        "--response-cache-mb",
+        type=int,
+        default=0,
+        help="Memory (MB) for replaying responses to identical /api/workload requests; "
+        "entries drop when their model/device configs change (default 0: off)",
+    )
     args = parser.parse_args()
 
     repo_root = resolve_repo_root(args.repo_root)
@@ -124,12 +321,21 @@ def main() -> int:
         "device_dir": device_dir,
     }
 
+    if args.response_cache_mb > 0:
+        Handler.response_cache = _ResponseCache(args.response_cache_mb * 1024 * 1024)
+    if args.workers > 1:
+        Handler.executor_workers = args.workers
+        Handler.executor = _make_executor(args.workers)
+
     server = ThreadingHTTPServer((args.host, args.port), Handler)
     sys.stderr.write(f"listening on http://{args.host}:{args.port}\n")
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         sys.stderr.write("shutdown\n")
+    finally:
+        if Handler.executor is not None:
+            Handler.executor.shutdown(cancel_futures=True)
     return 0
 
 
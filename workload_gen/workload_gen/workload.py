@@ -1,23 +1,65 @@
-from typing import List
+import functools
+from typing import List, Optional, Tuple
+
+# rank_table[dp][pp] is the tp group of that (dp, pp) slot.
+RankTable = List[List[Tuple[int, ...]]]
 
 
 def rank_for(dp_idx: int, pp_idx: int, tp_idx: int, dp_degree: int, pp_degree: int, tp_degree: int) -> int:
     return (dp_idx * pp_degree + pp_idx) * tp_degree + tp_idx
 
 
-def build_rank_map(dp_degree: int, pp_degree: int, tp_degree: int) -> List[dict]:
+def build_rank_table(dp_degree: int, pp_degree: int, tp_degree: int) -> RankTable:
+    # rank_table[dp][pp][tp] == rank_for(dp, pp, tp, ...), computed once per workload.
+    # Groups are tuples: every collective step of every member rank shares them.
+    return [
+        [tuple(rank_for(d, p, t, dp_degree, pp_degree, tp_degree) for t in range(tp_degree)) for p in range(pp_degree)]
+        for d in range(dp_degree)
+    ]
+
+
+def build_dp_groups(rank_table: RankTable) -> RankTable:
+    # dp_groups[pp][tp]: the same (pp, tp) slot across dp replicas. tp groups
+    # need no table of their own, they are the rows rank_table[dp][pp].
+    return [list(zip(*stage_rows)) for stage_rows in zip(*rank_table)]
+
+
+def build_rank_map(rank_table: RankTable) -> List[dict]:
     ranks = []
-    for dp_idx in range(dp_degree):
-        for pp_idx in range(pp_degree):
-            for tp_idx in range(tp_degree):
-                rank = rank_for(dp_idx, pp_idx, tp_idx, dp_degree, pp_degree, tp_degree)
+    for dp_idx, stages in enumerate(rank_table):
+        for pp_idx, row in enumerate(stages):
+            for tp_idx, rank in enumerate(row):
                 ranks.append({"id": rank, "dp": dp_idx, "pp": pp_idx, "tp": tp_idx})
     return ranks
 
 
+@functools.lru_cache(maxsize=1024)
+def pipeline_schedule(
+    mode: str, pipeline: str, pp_degree: int, pp_idx: int, microbatches: int
+) -> Tuple[Tuple[bool, int], ...]:
+    # (is_forward, microbatch) in execution order. It depends only on the stage,
+    # so it is computed once per stage and shared by all of the stage's ranks.
+    if mode == "inf":
+        return tuple((True, microbatch) for microbatch in range(microbatches))
+    if pipeline == "fwd_bwd":
+        return tuple((True, microbatch) for microbatch in range(microbatches)) + tuple(
+            (False, microbatch) for microbatch in range(microbatches)
+        )
+    # 1F1B: warmup forwards, then alternate forward/backward, then drain.
+    num_warmup = min(microbatches, pp_degree - pp_idx - 1)
+    schedule = [(True, microbatch) for microbatch in range(num_warmup)]
+    for bwd_idx, fwd_idx in enumerate(range(num_warmup, microbatches)):
+        schedule.append((True, fwd_idx))
+        schedule.append((False, bwd_idx))
+    schedule.extend((False, microbatch) for microbatch in range(microbatches - num_warmup, microbatches))
+    return tuple(schedule)
+
+
 def build_rank_steps(
     rank_info: dict,
     stage_stats: List[dict],
+    rank_table: RankTable,
+    dp_groups: RankTable,
     dp_degree: int,
     pp_degree: int,
     tp_degree: int,
@@ -29,34 +71,39 @@ def build_rank_steps(
     pp_idx = rank_info["pp"]
     tp_idx = rank_info["tp"]
 
-    tp_group = [rank_for(dp_idx, pp_idx, t, dp_degree, pp_degree, tp_degree) for t in range(tp_degree)]
-    dp_group = [rank_for(d, pp_idx, tp_idx, dp_degree, pp_degree, tp_degree) for d in range(dp_degree)]
+    tp_group = rank_table[dp_idx][pp_idx]
+    dp_group = dp_groups[pp_idx][tp_idx]
 
     prev_rank = None
     next_rank = None
     if pp_idx > 0:
-        prev_rank = rank_for(dp_idx, pp_idx - 1, tp_idx, dp_degree, pp_degree, tp_degree)
+        prev_rank = rank_table[dp_idx][pp_idx - 1][tp_idx]
     if pp_idx + 1 < pp_degree:
-        next_rank = rank_for(dp_idx, pp_idx + 1, tp_idx, dp_degree, pp_degree, tp_degree)
+        next_rank = rank_table[dp_idx][pp_idx + 1][tp_idx]
 
     stats = stage_stats[pp_idx]
+    # A stage's compute time is the same for every microbatch, so it is rounded
+    # once here rather than per step; None means the step is skipped.
+    fw_compute_ms = round(stats["fw_compute_ms"], 6) if stats["fw_compute_ms"] > 0 else None
+    bw_compute_ms = round(stats["bw_compute_ms"], 6) if stats["bw_compute_ms"] > 0 else None
     steps = []
 
-    def pp_comm_id(direction: str, src_stage: int, microbatch: int) -> str:
-        return f"pp-{direction}-s{src_stage}-mb{microbatch}-dp{dp_idx}-tp{tp_idx}"
-
-    def tp_comm_id(direction: str, microbatch: int) -> str:
-        return f"tp-{direction}-pp{pp_idx}-dp{dp_idx}-mb{microbatch}"
-
-    def dp_comm_id(direction: str, microbatch: int) -> str:
-        return f"dp-{direction}-pp{pp_idx}-tp{tp_idx}-mb{microbatch}"
-
-    def add_compute(label: str, ms: float) -> None:
-        if ms <= 0:
+    # Rank-invariant parts of the comm ids, formatted once per rank; only the
+    # microbatch is filled in per step.
+    pp_fwd_recv_id = f"pp-fwd-s{pp_idx - 1}-mb%d-dp{dp_idx}-tp{tp_idx}"
+    pp_fwd_send_id = f"pp-fwd-s{pp_idx}-mb%d-dp{dp_idx}-tp{tp_idx}"
+    pp_bwd_recv_id = f"pp-bwd-s{pp_idx + 1}-mb%d-dp{dp_idx}-tp{tp_idx}"
+    pp_bwd_send_id = f"pp-bwd-s{pp_idx}-mb%d-dp{dp_idx}-tp{tp_idx}"
+    tp_fwd_id = f"tp-fwd-pp{pp_idx}-dp{dp_idx}-mb"
+    tp_bwd_id = f"tp-bwd-pp{pp_idx}-dp{dp_idx}-mb"
+    dp_bwd_id = f"dp-bwd-pp{pp_idx}-tp{tp_idx}-mb"
+
+    def add_compute(label: str, ms: Optional[float]) -> None:
+        if ms is None:
             return
-        steps.append({"kind": "compute", "label": label, "compute_ms": round(ms, 6)})
+        steps.append({"kind": "compute", "label": label, "compute_ms": ms, "id": len(steps)})
 
-    def add_collective(label: str, op: str, comm_bytes: int, hosts: List[int], comm_id: str) -> None:
+    def add_collective(label: str, op: str, comm_bytes: int, hosts: Tuple[int, ...], comm_id: str) -> None:
         if comm_bytes <= 0:
             return
         steps.append(
@@ -67,6 +114,7 @@ def build_rank_steps(
                 "comm_bytes": int(comm_bytes),
                 "hosts": hosts,
                 "comm_id": comm_id,
+                "id": len(steps),
             }
         )
 
@@ -81,6 +129,7 @@ def build_rank_steps(
                 "peer": peer,
                 "direction": direction,
                 "comm_id": comm_id,
+                "id": len(steps),
             }
         )
 
@@ -91,15 +140,15 @@ def build_rank_steps(
                 stats["pp_bytes"],
                 prev_rank,
                 "recv",
-                pp_comm_id("fwd", pp_idx - 1, microbatch),
+                pp_fwd_recv_id % microbatch,
             )
-        add_compute(f"fwd_mb{microbatch}", stats["fw_compute_ms"])
+        add_compute(f"fwd_mb{microbatch}", fw_compute_ms)
         add_collective(
             f"tp_fwd_mb{microbatch}",
             "allreduce",
             stats["tp_fw_bytes"],
             tp_group,
-            tp_comm_id("fwd", microbatch),
+            tp_fwd_id + str(microbatch),
         )
         if next_rank is not None:
             add_sendrecv(
@@ -107,7 +156,7 @@ def build_rank_steps(
                 stats["pp_bytes"],
                 next_rank,
                 "send",
-                pp_comm_id("fwd", pp_idx, microbatch),
+                pp_fwd_send_id % microbatch,
             )
 
     def backward_step(microbatch: int) -> None:
@@ -117,22 +166,22 @@ def build_rank_steps(
                 stats["pp_bytes"],
                 next_rank,
                 "recv",
-                pp_comm_id("bwd", pp_idx + 1, microbatch),
+                pp_bwd_recv_id % microbatch,
             )
-        add_compute(f"bwd_mb{microbatch}", stats["bw_compute_ms"])
+        add_compute(f"bwd_mb{microbatch}", bw_compute_ms)
         add_collective(
             f"tp_bwd_mb{microbatch}",
             "allreduce",
             stats["tp_bw_bytes"],
             tp_group,
-            tp_comm_id("bwd", microbatch),
+            tp_bwd_id + str(microbatch),
         )
         add_collective(
             f"dp_bwd_mb{microbatch}",
             "allreduce",
             stats["dp_bw_bytes"],
             dp_group,
-            dp_comm_id("bwd", microbatch),
+            dp_bwd_id + str(microbatch),
         )
         if prev_rank is not None:
             add_sendrecv(
@@ -140,37 +189,13 @@ def build_rank_steps(
                 stats["pp_bytes"],
                 prev_rank,
                 "send",
-                pp_comm_id("bwd", pp_idx, microbatch),
+                pp_bwd_send_id % microbatch,
             )
 
-    if mode == "inf":
-        for microbatch in range(microbatches):
-            forward_step(microbatch)
-    elif pipeline == "fwd_bwd":
-        for microbatch in range(microbatches):
+    for forward, microbatch in pipeline_schedule(mode, pipeline, pp_degree, pp_idx, microbatches):
+        if forward:
             forward_step(microbatch)
-        for microbatch in range(microbatches):
+        else:
             backward_step(microbatch)
-    else:
-        num_warmup = min(microbatches, pp_degree - pp_idx - 1)
-        num_remaining = microbatches - num_warmup
-        fwd_idx = 0
-        bwd_idx = 0
-
-        for _ in range(num_warmup):
-            forward_step(fwd_idx)
-            fwd_idx += 1
-
-        for _ in range(num_remaining):
-            forward_step(fwd_idx)
-            fwd_idx += 1
-            backward_step(bwd_idx)
-            bwd_idx += 1
-
-        while bwd_idx < microbatches:
-            backward_step(bwd_idx)
-            bwd_idx += 1
-
-    for idx, step in enumerate(steps):
-        step["id"] = idx
+
     return steps